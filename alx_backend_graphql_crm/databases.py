@@ -0,0 +1,118 @@
+"""
+Database profiles, chosen with the CRM_DB_PROFILE environment variable
+
+* ``sqlite`` (default): db.sqlite3 as Django configures it, for development.
+* ``sqlite-wal``: SQLite tuned for local and edge deployments. Every new
+  connection runs ``sqlite_pragmas()`` (Django's ``init_command``): WAL
+  journaling so readers do not block the writer, ``synchronous=NORMAL``
+  (durable at every checkpoint rather than every commit), and a
+  configurable page cache, mmap size and temp store. Transactions start
+  with ``BEGIN IMMEDIATE``, so a writer takes the write lock up front and
+  waits out the busy timeout. With the default ``BEGIN DEFERRED``, a
+  transaction that reads before it writes fails at once with "database is
+  locked" when another writer holds the lock. Connections are persistent.
+* ``postgres``: PostgreSQL through psycopg 3 (``pip install
+  "psycopg[binary,pool]"``). By default each process keeps a connection
+  pool, and requests borrow an open connection instead of connecting.
+  With ``CRM_DB_POOL=0``, connections persist for ``CONN_MAX_AGE``
+  seconds instead, for deployments behind an external pooler such as
+  PgBouncer. Django cannot combine its pool with CONN_MAX_AGE.
+
+Every profile reads its connection details from ``CRM_DB_*`` variables;
+see ``database_settings`` for the full list.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgres')
+TEMP_STORES = ('DEFAULT', 'FILE', 'MEMORY')
+
+
+def database_settings(base_dir, profile=None):
+    """The DATABASES setting for ``profile`` (default: CRM_DB_PROFILE)"""
+    profile = profile or os.environ.get('CRM_DB_PROFILE', 'sqlite')
+    if profile == 'sqlite':
+        return {'default': _sqlite(base_dir)}
+    if profile == 'sqlite-wal':
+        return {'default': _sqlite_wal(base_dir)}
+    if profile == 'postgres':
+        return {'default': _postgres()}
+    raise ImproperlyConfigured(
+        f"Unknown CRM_DB_PROFILE '{profile}'; choose from {', '.join(PROFILES)}"
+    )
+
+
+def _sqlite(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('CRM_DB_NAME') or base_dir / 'db.sqlite3',
+    }
+
+
+def sqlite_pragmas():
+    """The PRAGMA statements run on every new sqlite-wal connection"""
+    temp_store = os.environ.get('CRM_DB_TEMP_STORE', 'MEMORY').upper()
+    if temp_store not in TEMP_STORES:
+        raise ImproperlyConfigured(
+            f"CRM_DB_TEMP_STORE must be one of {', '.join(TEMP_STORES)}, got '{temp_store}'"
+        )
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        # Negative sizes are in KiB rather than pages. CRM_DB_CACHE_SIZE is
+        # in KiB either way, so SQLite's own "-N" spelling also works.
+        f"PRAGMA cache_size=-{abs(_env_int('CRM_DB_CACHE_SIZE', 64 * 1024))}",
+        f"PRAGMA mmap_size={_env_int('CRM_DB_MMAP_SIZE', 256 * 1024 * 1024)}",
+        f"PRAGMA temp_store={temp_store}",
+    ]
+
+
+def _sqlite_wal(base_dir):
+    return {
+        **_sqlite(base_dir),
+        # Reconnecting would run the pragmas again on every request
+        'CONN_MAX_AGE': _env_int('CRM_DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for a lock before "database is locked"
+            'timeout': _env_int('CRM_DB_BUSY_TIMEOUT', 20),
+            'init_command': ';'.join(sqlite_pragmas()),
+            'transaction_mode': os.environ.get('CRM_DB_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+    }
+
+
+def _postgres():
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('CRM_DB_NAME', 'crm'),
+        'USER': os.environ.get('CRM_DB_USER', 'crm'),
+        'PASSWORD': os.environ.get('CRM_DB_PASSWORD', ''),
+        'HOST': os.environ.get('CRM_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('CRM_DB_PORT', '5432'),
+        'OPTIONS': {},
+    }
+    if _env_int('CRM_DB_POOL', 1):
+        database['OPTIONS']['pool'] = {
+            'min_size': _env_int('CRM_DB_POOL_MIN_SIZE', 2),
+            'max_size': _env_int('CRM_DB_POOL_MAX_SIZE', 10),
+            # Seconds a request waits for a free connection
+            'timeout': _env_int('CRM_DB_POOL_TIMEOUT', 10),
+        }
+    else:
+        database['CONN_MAX_AGE'] = _env_int('CRM_DB_CONN_MAX_AGE', 600)
+        database['CONN_HEALTH_CHECKS'] = True
+    return database
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f"{name} must be an integer, got '{value}'")
@@ -16,10 +16,16 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, cache_stats, export
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(gzip_page(CRMGraphQLView.as_view(graphiql=True)))),
+    path("graphql/async", csrf_exempt(gzip_page(AsyncCRMGraphQLView.as_view(graphiql=True)))),
+    path("graphql/batch", csrf_exempt(gzip_page(CRMGraphQLView.as_view(batch=True)))),
+    path("graphql/async/batch", csrf_exempt(gzip_page(AsyncCRMGraphQLView.as_view(batch=True)))),
+    path("graphql/cache-stats", cache_stats),
+    path("export/<str:name>", export),
 ]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark: sync GraphQL view (WSGI) vs async view (ASGI).
+
+In-process (default), the sync endpoint is driven by a thread pool of
+django.test.Client instances and the async endpoint by concurrent
+AsyncClient requests on one event loop:
+
+    python benchmark_asgi.py --requests 500 --concurrency 50
+
+Against running servers, e.g. ``gunicorn alx_backend_graphql_crm.wsgi`` and
+``uvicorn alx_backend_graphql_crm.asgi:application``, both endpoints are
+driven by a thread pool of HTTP clients:
+
+    python benchmark_asgi.py --wsgi-url http://localhost:8000/graphql \\
+        --asgi-url http://localhost:8001/graphql/async
+
+Seed the database first (seed_db.py). The response cache is disabled for
+in-process runs so every request executes the query.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+import django
+django.setup()
+
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment
+
+
+DEFAULT_QUERY = """
+{
+  allOrders {
+    id
+    totalAmount
+    customer { name email }
+    products { edges { node { name price } } }
+  }
+  allCustomers { name orders { edges { node { id } } } }
+}
+"""
+
+
+def report(label, latencies, elapsed, failures):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    p95 = latencies[max(int(count * 0.95) - 1, 0)] if latencies else 0
+    print(
+        f"{label:<6} {count / elapsed:8.1f} req/s   "
+        f"p50 {statistics.median(latencies) * 1000 if latencies else 0:7.1f} ms   "
+        f"p95 {p95 * 1000:7.1f} ms   failures {failures}"
+    )
+
+
+def run_threads(send, requests, concurrency):
+    """Call ``send()`` ``requests`` times from ``concurrency`` threads"""
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            ok = send()
+        finally:
+            connections.close_all()
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    return [latency for latency, _ in results], elapsed, sum(1 for _, ok in results if not ok)
+
+
+async def run_tasks(send, requests, concurrency):
+    """Await ``send()`` ``requests`` times with at most ``concurrency`` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            ok = await send()
+            return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[timed() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    return [latency for latency, _ in results], elapsed, sum(1 for _, ok in results if not ok)
+
+
+def succeeded(status_code, body):
+    return status_code == 200 and 'errors' not in json.loads(body)
+
+
+def in_process(payload, requests, concurrency):
+    setup_test_environment()
+    body = json.dumps(payload)
+
+    def send_sync():
+        response = Client().post('/graphql', body, content_type='application/json')
+        return succeeded(response.status_code, response.content)
+
+    client = AsyncClient()
+
+    async def send_async():
+        response = await client.post('/graphql/async', body, content_type='application/json')
+        return succeeded(response.status_code, response.content)
+
+    with override_settings(CRM_GRAPHQL_CACHE=None):
+        # Warm up the document cache and the database connection
+        send_sync()
+        asyncio.run(send_async())
+
+        report('WSGI', *run_threads(send_sync, requests, concurrency))
+        report('ASGI', *asyncio.run(run_tasks(send_async, requests, concurrency)))
+
+
+def over_http(payload, requests, concurrency, wsgi_url, asgi_url):
+    import requests as http
+
+    for label, url in (('WSGI', wsgi_url), ('ASGI', asgi_url)):
+        if not url:
+            continue
+        local = threading.local()
+
+        def send():
+            if not hasattr(local, 'session'):
+                local.session = http.Session()
+            response = local.session.post(url, json=payload, timeout=60)
+            return succeeded(response.status_code, response.content)
+
+        send()
+        report(label, *run_threads(send, requests, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--query', default=DEFAULT_QUERY, help='GraphQL query to send')
+    parser.add_argument('--wsgi-url', help='Benchmark a running WSGI server instead')
+    parser.add_argument('--asgi-url', help='Benchmark a running ASGI server instead')
+    args = parser.parse_args()
+
+    payload = {'query': args.query}
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    if args.wsgi_url or args.asgi_url:
+        over_http(payload, args.requests, args.concurrency, args.wsgi_url, args.asgi_url)
+    else:
+        in_process(payload, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
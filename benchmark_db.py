@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Request latency benchmark across the database profiles (CRM_DB_PROFILE).
+
+Each profile runs in its own process against a throwaway test database:
+a sqlite file in a temporary directory, or ``test_<CRM_DB_NAME>`` on the
+PostgreSQL server (the user needs CREATEDB). The database is seeded and
+then driven through /graphql by a pool of threads sending a mix of list
+queries and createCustomer mutations:
+
+    python benchmark_db.py --profiles sqlite sqlite-wal postgres \\
+        --requests 500 --concurrency 10 --write-ratio 0.2
+
+Connections are opened and closed around every request as Django does for
+real requests, so the results include each profile's connection handling
+(CONN_MAX_AGE, pooling). The response cache is disabled.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+
+READ_QUERY = """
+query ($first: Int) {
+  customers(first: $first) {
+    edges { node { name email orders { edges { node { id totalAmount } } } } }
+  }
+}
+"""
+
+WRITE_MUTATION = """
+mutation ($input: CustomerInput!) {
+  createCustomer(input: $input) { customer { id } errors }
+}
+"""
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0
+    latencies = sorted(latencies)
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)]
+
+
+def report(label, reads, writes, elapsed, failures):
+    count = len(reads) + len(writes)
+    print(
+        f"{label:<11} {count / elapsed:8.1f} req/s   "
+        f"read p50 {percentile(reads, 0.5) * 1000:7.1f} ms  p95 {percentile(reads, 0.95) * 1000:7.1f} ms   "
+        f"write p50 {percentile(writes, 0.5) * 1000:7.1f} ms  p95 {percentile(writes, 0.95) * 1000:7.1f} ms   "
+        f"failures {failures}",
+        flush=True,
+    )
+
+
+def seed(customers):
+    from crm.models import Customer, Order, OrderItem, Product
+
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal('9.99'), stock=100) for i in range(20)
+    )
+    created = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com") for i in range(customers)
+    )
+    orders = Order.objects.bulk_create(
+        Order(customer=customer, total_amount=Decimal('19.98')) for customer in created for _ in range(3)
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=random.choice(products), quantity=2, price=Decimal('9.99'))
+        for order in orders
+    )
+
+
+def run_profile(requests, concurrency, write_ratio, customers):
+    """Benchmark the profile this process was started with"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    import django
+    django.setup()
+
+    from django.db import close_old_connections, connection, connections
+    from django.test import Client
+    from django.test.utils import override_settings, setup_test_environment
+
+    setup_test_environment()
+    profile = os.environ.get('CRM_DB_PROFILE', 'sqlite')
+    temp_dir = None
+    if connection.vendor == 'sqlite':
+        # An on-disk file, since the default sqlite test database is in memory
+        temp_dir = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(temp_dir.name, 'benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    reads = []
+    writes = []
+    failures = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def send(write):
+        if write:
+            body = {'query': WRITE_MUTATION, 'variables': {'input': {
+                'name': 'Benchmark', 'email': f"{uuid.uuid4().hex}@example.com",
+            }}}
+        else:
+            body = {'query': READ_QUERY, 'variables': {'first': 20}}
+        # What Django's request_started and request_finished handlers do
+        close_old_connections()
+        try:
+            response = Client().post('/graphql', json.dumps(body), content_type='application/json')
+        finally:
+            close_old_connections()
+        return response.status_code == 200 and 'errors' not in response.json()
+
+    def worker():
+        try:
+            for _ in counter:
+                write = random.random() < write_ratio
+                start = time.perf_counter()
+                try:
+                    ok = send(write)
+                except Exception:
+                    ok = False
+                latency = time.perf_counter() - start
+                with lock:
+                    (writes if write else reads).append(latency)
+                    if not ok:
+                        failures.append(latency)
+        finally:
+            connections.close_all()
+
+    try:
+        with override_settings(CRM_GRAPHQL_CACHE=None):
+            seed(customers)
+            # Warm up the document cache
+            send(False)
+            send(True)
+
+            threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report(profile, reads, writes, time.perf_counter() - start, len(failures))
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profiles', nargs='+', default=['sqlite', 'sqlite-wal'])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of requests that are mutations')
+    parser.add_argument('--customers', type=int, default=200, help='Customers to seed (3 orders each)')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args.requests, args.concurrency, args.write_ratio, args.customers)
+        return
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.write_ratio:.0%} writes")
+    for profile in args.profiles:
+        # The profile is read when settings load, so each needs its own process
+        result = subprocess.run(
+            [sys.executable, __file__, '--run', *sys.argv[1:]],
+            env={**os.environ, 'CRM_DB_PROFILE': profile},
+        )
+        if result.returncode:
+            print(f"{profile:<11} failed (exit status {result.returncode})")
+
+
+if __name__ == "__main__":
+    main()
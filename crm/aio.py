@@ -0,0 +1,76 @@
+"""
+Helpers for resolvers that run under both sync and async execution
+
+Resolvers check ``running_async()`` and return a coroutine using Django's
+async ORM API when the schema is being executed by the async view; under
+the sync view they keep returning plain values.
+"""
+
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Model
+from graphene.utils.str_converters import to_snake_case
+
+from .optimizer import PAGINATION_ARGS, is_loaded
+
+
+def running_async():
+    """True when called from a thread that is running an event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+async def alist(queryset):
+    """Evaluate ``queryset`` (prefetches included) with async iteration"""
+    return [obj async for obj in queryset]
+
+
+async def aget_or_none(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+def run_sync(func, *args, **kwargs):
+    """Call ``func`` directly, or in a worker thread under async execution"""
+    if running_async():
+        return sync_to_async(func)(*args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def threaded(func):
+    """Decorator: run ``func`` in a worker thread under async execution"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_sync(func, *args, **kwargs)
+    return wrapper
+
+
+class ThreadedRelationMiddleware:
+    """
+    Graphene middleware for async execution.
+
+    Columns and relations that the root resolver already select_related or
+    prefetched are resolved on the event loop. Relations that still need a
+    query (DataLoader batches, filtered connections) run in a worker thread;
+    sync_to_async is thread-sensitive, so every such query of a request
+    shares one thread and database connection. Must be the outermost
+    middleware so LoaderMiddleware runs inside that thread.
+    """
+
+    def resolve(self, next, root, info, **args):
+        if isinstance(root, Model):
+            filtered = any(
+                value is not None
+                for key, value in args.items()
+                if key not in PAGINATION_ARGS
+            )
+            if not is_loaded(root, to_snake_case(info.field_name), filtered):
+                return sync_to_async(next)(root, info, **args)
+        return next(root, info, **args)
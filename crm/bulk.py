@@ -0,0 +1,274 @@
+"""
+Set-based bulk creation for the CRM models
+
+Rows are validated in memory, uniqueness is checked with one ``IN``
+lookup per chunk instead of one query per row, and inserts go through
+chunked ``bulk_create`` calls. Errors are still reported per row.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .models import Customer, Order, OrderItem, Product
+from .orders import OrderError, build_order, merge_lines
+from .rollups import record_orders
+from .stock import InsufficientStock, reserve_stock
+from .validators import is_valid_phone
+
+
+def get_chunk_size(chunk_size=None):
+    """
+    Rows per bulk_create call, from CRM_BULK_CHUNK_SIZE by default. Raises
+    ValueError for sizes below 1, which would insert nothing.
+    """
+    if chunk_size is None:
+        return getattr(settings, 'CRM_BULK_CHUNK_SIZE', 1000)
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1")
+    return chunk_size
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def existing_emails(emails, chunk_size):
+    """Return the subset of ``emails`` that is already taken"""
+    taken = set()
+    for chunk in chunked(list(emails), chunk_size):
+        taken.update(
+            Customer.objects.filter(email__in=chunk).values_list('email', flat=True)
+        )
+    return taken
+
+
+def bulk_create_customers(rows, chunk_size=None):
+    """
+    Create customers from ``rows`` (objects with name, email and phone).
+
+    Returns ``(customers, errors)`` where errors holds one message per
+    rejected row, in input order.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    name_length = Customer._meta.get_field('name').max_length
+    phone_length = Customer._meta.get_field('phone').max_length
+    errors = []
+    candidates = []
+    seen = set()
+
+    for index, row in enumerate(rows):
+        if row.email in seen:
+            errors.append((index, f"Email {row.email} already exists"))
+            continue
+
+        if row.phone and not is_valid_phone(row.phone):
+            errors.append((index, f"Invalid phone format for {row.email}"))
+            continue
+
+        if len(row.name) > name_length or len(row.phone or "") > phone_length:
+            errors.append((index, f"Error creating {row.email}: value too long"))
+            continue
+
+        # Only valid rows claim their email, so a later valid duplicate of
+        # a rejected row is still created
+        seen.add(row.email)
+        customer = Customer(name=row.name, email=row.email, phone=row.phone or "")
+        candidates.append((index, customer))
+
+    taken = existing_emails(seen, chunk_size)
+    customers = []
+    for index, customer in candidates:
+        if customer.email in taken:
+            errors.append((index, f"Email {customer.email} already exists"))
+        else:
+            customers.append((index, customer))
+
+    created = []
+    with transaction.atomic():
+        for chunk in chunked(customers, chunk_size):
+            created.extend(_insert_customers(chunk, errors))
+
+    errors.sort(key=lambda error: error[0])
+    return created, [message for _, message in errors]
+
+
+def _insert_customers(chunk, errors):
+    try:
+        with transaction.atomic():
+            return Customer.objects.bulk_create([customer for _, customer in chunk])
+    except IntegrityError:
+        pass
+
+    # Another writer took some of these emails after the probe;
+    # probe again for this chunk only and insert the remainder
+    taken = existing_emails([customer.email for _, customer in chunk], len(chunk))
+    remaining = []
+    for index, customer in chunk:
+        if customer.email in taken:
+            errors.append((index, f"Email {customer.email} already exists"))
+        else:
+            remaining.append((index, customer))
+    try:
+        with transaction.atomic():
+            return Customer.objects.bulk_create([customer for _, customer in remaining])
+    except IntegrityError:
+        pass
+
+    # Still racing a concurrent writer; insert one row per savepoint
+    created = []
+    for index, customer in remaining:
+        try:
+            with transaction.atomic():
+                created.extend(Customer.objects.bulk_create([customer]))
+        except IntegrityError:
+            errors.append((index, f"Email {customer.email} already exists"))
+    return created
+
+
+def bulk_create_products(rows, chunk_size=None):
+    """
+    Create products from ``rows`` (objects with name, price and stock).
+
+    Returns one ``{'index', 'product', 'errors'}`` result per row. Each
+    chunk is inserted under its own savepoint, so a failing chunk only
+    rejects its own rows.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    results = []
+    pending = []
+
+    for index, row in enumerate(rows):
+        result = {'index': index, 'product': None, 'errors': []}
+        results.append(result)
+
+        if row.price is None or row.price <= 0:
+            result['errors'].append("Price must be positive")
+        if row.stock is not None and row.stock < 0:
+            result['errors'].append("Stock cannot be negative")
+        if result['errors']:
+            continue
+
+        product = Product(name=row.name, price=Decimal(str(row.price)), stock=row.stock or 0)
+        pending.append((result, product))
+
+    with transaction.atomic():
+        for chunk in chunked(pending, chunk_size):
+            try:
+                with transaction.atomic():
+                    Product.objects.bulk_create([product for _, product in chunk])
+            except DatabaseError as e:
+                for result, _ in chunk:
+                    result['errors'].append(str(e))
+                continue
+            for result, product in chunk:
+                result['product'] = product
+
+    return results
+
+
+def bulk_create_orders(rows, chunk_size=None):
+    """
+    Create orders from ``rows`` (objects with customer_id, product_ids and
+    optional quantities).
+
+    Customers and products for the whole batch are fetched with one
+    ``in_bulk`` each. Every chunk reserves stock for all of its orders at
+    once and inserts orders and items with one ``bulk_create`` each; if
+    the chunk is short of stock it falls back to one order at a time so
+    only the orders that cannot be filled are rejected.
+
+    Returns one ``{'index', 'order', 'errors'}`` result per row.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    results = []
+    parsed = []
+
+    customer_ids = set()
+    product_ids = set()
+    for index, row in enumerate(rows):
+        result = {'index': index, 'order': None, 'errors': []}
+        results.append(result)
+        try:
+            customer_id = int(row.customer_id)
+        except (TypeError, ValueError):
+            result['errors'].append("Invalid customer ID")
+            continue
+        try:
+            lines = merge_lines(row.product_ids, row.quantities)
+        except OrderError as e:
+            result['errors'].append(str(e))
+            continue
+        customer_ids.add(customer_id)
+        product_ids.update(lines)
+        parsed.append((result, customer_id, lines))
+
+    customers = {}
+    for chunk in chunked(list(customer_ids), chunk_size):
+        customers.update(Customer.objects.in_bulk(chunk))
+    products = {}
+    for chunk in chunked(list(product_ids), chunk_size):
+        products.update(Product.objects.in_bulk(chunk))
+
+    pending = []
+    for result, customer_id, lines in parsed:
+        if customer_id not in customers:
+            result['errors'].append("Invalid customer ID")
+            continue
+        missing = [product_id for product_id in lines if product_id not in products]
+        if missing:
+            result['errors'].append(f"Invalid product ID: {missing[0]}")
+            continue
+        order, items = build_order(customers[customer_id], lines, products)
+        pending.append((result, lines, order, items))
+
+    with transaction.atomic():
+        for chunk in chunked(pending, chunk_size):
+            _insert_order_chunk(chunk)
+
+    return results
+
+
+def _insert_order_chunk(chunk):
+    totals = {}
+    for _, lines, _, _ in chunk:
+        for product_id, quantity in lines.items():
+            totals[product_id] = totals.get(product_id, 0) + quantity
+
+    try:
+        with transaction.atomic():
+            reserve_stock(totals)
+            _insert_orders(chunk)
+        return
+    except InsufficientStock:
+        pass
+    except DatabaseError as e:
+        for result, _, _, _ in chunk:
+            result['errors'].append(str(e))
+        return
+
+    # Not enough stock for the whole chunk; place the orders one by one
+    for entry in chunk:
+        result = entry[0]
+        try:
+            with transaction.atomic():
+                reserve_stock(entry[1])
+                _insert_orders([entry])
+        except (InsufficientStock, DatabaseError) as e:
+            result['errors'].append(str(e))
+
+
+def _insert_orders(chunk):
+    orders = Order.objects.bulk_create([order for _, _, order, _ in chunk])
+    items = []
+    for order, (_, _, _, order_items) in zip(orders, chunk):
+        for item in order_items:
+            item.order = order
+        items.extend(order_items)
+    OrderItem.objects.bulk_create(items)
+    # bulk_create sends no post_save signals
+    record_orders(orders)
+    for result, _, order, _ in chunk:
+        result['order'] = order
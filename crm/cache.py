@@ -0,0 +1,199 @@
+"""
+Cross-request response cache for read-only GraphQL queries
+
+Responses are stored in a Django cache alias (CRM_GRAPHQL_CACHE, a
+local-memory cache by default), so the backend can be swapped for the
+file-based cache or anything else Django supports without code changes.
+
+Entries are keyed on the normalized query text, the variables and the
+operation name. Each entry records a generation token for every model the
+query reads; mutations replace the tokens of the models they write, which
+makes exactly the entries that depend on those models stale. The tokens
+live in the same backend, so with the default local-memory cache a mutation
+only evicts entries in the process that ran it. Hit, miss and
+eviction counters are kept in the same cache so they are shared between
+processes when the backend is.
+"""
+
+import hashlib
+import json
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from graphene.utils.str_converters import to_snake_case
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+from graphql.utilities import get_operation_ast
+
+from .documents import get_document
+
+
+KEY_PREFIX = 'crm-graphql'
+
+COUNTERS = ('hits', 'misses', 'evictions')
+
+
+QueryPlan = namedtuple('QueryPlan', ['operation', 'normalized', 'reads', 'writes'])
+
+
+def get_response_cache():
+    """Return the ResponseCache configured by CRM_GRAPHQL_CACHE, or None"""
+    alias = getattr(settings, 'CRM_GRAPHQL_CACHE', None)
+    if alias is None:
+        return None
+    return ResponseCache(caches[alias])
+
+
+def invalidate_models(*models):
+    """Make cached responses that read any of ``models`` stale"""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.invalidate(*[_label(model) for model in models])
+
+
+class ResponseCache:
+    """Response storage, model invalidation and counters on one cache backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def key(self, normalized, variables, operation_name, pretty=False):
+        payload = json.dumps(
+            [normalized, variables or {}, operation_name, bool(pretty)],
+            sort_keys=True,
+            default=str,
+        )
+        return f'{KEY_PREFIX}:response:{hashlib.sha256(payload.encode()).hexdigest()}'
+
+    def generations(self, labels):
+        """Current generation token of each model label, creating missing ones"""
+        keys = {label: self._generation_key(label) for label in labels}
+        current = self.backend.get_many(keys.values())
+        tokens = {}
+        for label, key in keys.items():
+            token = current.get(key)
+            if token is None:
+                token = uuid.uuid4().hex
+                # Another process may have created the token first
+                if not self.backend.add(key, token, timeout=None):
+                    token = self.backend.get(key, token)
+            tokens[label] = token
+        return tokens
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count('misses')
+            return None
+
+        if entry['generations'] != self.generations(entry['generations']):
+            self.backend.delete(key)
+            self._count('evictions')
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return entry['response']
+
+    def set(self, key, response, generations):
+        """
+        Store ``response``. ``generations`` must be read before the query
+        ran so a concurrent invalidation leaves the entry stale.
+        """
+        self.backend.set(key, {'response': response, 'generations': generations})
+
+    def invalidate(self, *labels):
+        """Replace the generation tokens of the given model labels"""
+        self.backend.set_many(
+            {self._generation_key(label): uuid.uuid4().hex for label in labels},
+            timeout=None,
+        )
+
+    def stats(self):
+        keys = {name: f'{KEY_PREFIX}:stats:{name}' for name in COUNTERS}
+        values = self.backend.get_many(keys.values())
+        return {name: values.get(key, 0) for name, key in keys.items()}
+
+    def _count(self, name):
+        key = f'{KEY_PREFIX}:stats:{name}'
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            if not self.backend.add(key, 1, timeout=None):
+                self.backend.incr(key)
+
+    def _generation_key(self, label):
+        return f'{KEY_PREFIX}:generation:{label}'
+
+
+def analyze_query(schema, query, operation_name, validation_rules=None):
+    """
+    Return the QueryPlan of ``query``: its operation type, normalized
+    text, and the labels of the models it reads and writes. Returns None
+    when the document is invalid or has no matching operation.
+    """
+    document = get_document(schema, query, validation_rules)
+    if document.errors:
+        return None
+
+    key = ('cache', operation_name)
+    if key not in document.plans:
+        document.plans[key] = _plan(schema, document.ast, operation_name)
+    return document.plans[key]
+
+
+def _plan(schema, document, operation_name):
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return None
+
+    type_info = TypeInfo(schema)
+    collector = _ModelCollector(type_info)
+    visit(document, TypeInfoVisitor(type_info, collector))
+    return QueryPlan(
+        operation=operation.operation.value,
+        normalized=print_ast(document),
+        reads=frozenset(collector.reads),
+        writes=frozenset(collector.writes),
+    )
+
+
+class _ModelCollector(Visitor):
+    """Collect the models behind every type a document selects"""
+
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.reads = set()
+        self.writes = set()
+
+    def enter_field(self, node, *args):
+        # The root Mutation type maps each of its fields to the models it writes
+        parent_type = getattr(self.type_info.get_parent_type(), 'graphene_type', None)
+        invalidates = getattr(parent_type, 'invalidates', None) or {}
+        self.writes.update(
+            _label(model) for model in invalidates.get(to_snake_case(node.name.value), ())
+        )
+
+        field_type = self.type_info.get_type()
+        graphene_type = getattr(get_named_type(field_type), 'graphene_type', None)
+        if graphene_type is not None:
+            self.reads.update(_label(model) for model in _graphene_models(graphene_type))
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _graphene_models(graphene_type):
+    """Models a graphene type reads, including the node type of connections"""
+    meta = getattr(graphene_type, '_meta', None)
+    models = []
+    if getattr(meta, 'model', None) is not None:
+        models.append(meta.model)
+    node = getattr(meta, 'node', None)
+    if node is not None:
+        models.extend(_graphene_models(node))
+    models.extend(getattr(graphene_type, 'cache_models', ()))
+    return models
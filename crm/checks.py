@@ -0,0 +1,69 @@
+"""
+System checks for the CRM application
+"""
+
+from django.core.checks import Tags, Warning, register
+from django.core.exceptions import FieldDoesNotExist
+
+
+# Lookups a B-tree index can serve. Substring matches such as icontains
+# cannot use an ordinary index and are not reported.
+INDEXABLE_LOOKUPS = {
+    'exact', 'iexact', 'gt', 'gte', 'lt', 'lte', 'in', 'range',
+    'startswith', 'isnull', 'date', 'year',
+}
+
+
+def is_indexed(field):
+    """Return True when ``field`` is the leading column of some index"""
+    if field.primary_key or field.unique or getattr(field, 'db_index', False):
+        return True
+
+    opts = field.model._meta
+    leading = [index.fields[0].lstrip('-') for index in opts.indexes if index.fields]
+    leading += [fields[0] for fields in opts.unique_together]
+    leading += [
+        constraint.fields[0]
+        for constraint in opts.constraints
+        if getattr(constraint, 'fields', None)
+    ]
+    return field.name in leading
+
+
+def resolve_field(model, path):
+    """Follow a ``a__b__c`` path from ``model`` to the final model field"""
+    field = None
+    for name in path.split('__'):
+        if field is not None:
+            model = field.related_model
+        field = model._meta.get_field(name)
+    return field
+
+
+@register(Tags.models)
+def check_filter_indexes(app_configs, **kwargs):
+    """Flag FilterSet fields whose column has no index behind it"""
+    from .filters import CustomerFilter, OrderFilter, ProductFilter
+
+    warnings = []
+    for filterset in (CustomerFilter, ProductFilter, OrderFilter):
+        model = filterset._meta.model
+        for name, filter_ in filterset.base_filters.items():
+            if filter_.method or filter_.lookup_expr not in INDEXABLE_LOOKUPS:
+                continue
+            try:
+                field = resolve_field(model, filter_.field_name)
+            except FieldDoesNotExist:
+                continue
+            if field.is_relation and not field.concrete:
+                # Filtering on a reverse relation compares the related primary key
+                field = field.related_model._meta.pk
+            if not is_indexed(field):
+                warnings.append(Warning(
+                    f"{filterset.__name__}.{name} filters on "
+                    f"{field.model.__name__}.{field.name}, which has no index.",
+                    hint="Add an index for this column in crm/models.py.",
+                    obj=filterset,
+                    id='crm.W001',
+                ))
+    return warnings
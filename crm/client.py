@@ -0,0 +1,299 @@
+"""
+GraphQL client for the cron jobs and Celery tasks
+
+Background jobs run their operations through ``get_client()``. By default
+the operation is executed in-process by the same pipeline as the
+``/graphql`` endpoint (document cache, validation, cost budget, mutation
+cache invalidation), so jobs keep working when the web tier is busy or
+down and skip HTTP and JSON round trips. Responses keep the endpoint's
+semantics: ``status_code`` is 400 for operations that could not run and
+``errors`` holds the formatted GraphQL errors. A ``timeout`` is enforced
+as a deadline checked before each database query; an operation that
+passes it is abandoned and GraphQLTransportError is raised, as it is when
+an HTTP request times out.
+
+Setting ``CRM_GRAPHQL_TRANSPORT = 'http'`` switches to posting to
+``CRM_GRAPHQL_URL`` (and batches to ``CRM_GRAPHQL_BATCH_URL``) over a
+pooled keep-alive session; see HTTPTransport.
+"""
+
+import gzip
+import json
+import random
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.http import HttpRequest
+from graphql import GraphQLError, OperationType, get_operation_ast, parse
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, NewConnectionError
+
+from .queries import PERSISTED_QUERIES, persisted_payload
+from .views import CRMGraphQLView
+
+
+DEFAULT_URL = 'http://localhost:8000/graphql'
+DEFAULT_BATCH_URL = 'http://localhost:8000/graphql/batch'
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 10
+
+# Seconds allowed to establish a connection, whatever the operation timeout
+CONNECT_TIMEOUT = 5
+BACKOFF = 0.5
+BACKOFF_CAP = 10
+# Request bodies larger than this many bytes are gzip-compressed
+GZIP_THRESHOLD = 1024
+
+
+class GraphQLResponse(namedtuple('GraphQLResponse', ['status_code', 'data', 'errors'])):
+    """The status code and body of a GraphQL response"""
+
+    @property
+    def ok(self):
+        return self.status_code == 200 and not self.errors
+
+
+class Operation(namedtuple('Operation', ['query', 'variables', 'operation_name'])):
+    """One operation of a batch"""
+
+    def __new__(cls, query, variables=None, operation_name=None):
+        return super().__new__(cls, query, variables, operation_name)
+
+
+class GraphQLTransportError(Exception):
+    """Raised when an operation could not be delivered to the endpoint"""
+
+
+class InProcessTransport:
+    """
+    Executes operations in this process through CRMGraphQLView.
+
+    There is no socket to time out, so ``timeout`` is a deadline checked
+    before each database query. Once it has passed, the remaining queries
+    fail and GraphQLTransportError is raised. As with an HTTP timeout, a
+    mutation may have been partly applied by then.
+    """
+
+    def __init__(self):
+        self.view = CRMGraphQLView()
+        self.batch_view = CRMGraphQLView(batch=True)
+
+    def execute(self, query, variables=None, operation_name=None, timeout=None):
+        with _deadline(timeout):
+            return self._execute(_request(), query, variables, operation_name)
+
+    def execute_batch(self, operations, timeout=None):
+        # One request object, so the operations share their DataLoaders
+        request = _request()
+        with _deadline(timeout):
+            return [
+                self._execute(request, *Operation(*operation), view=self.batch_view)
+                for operation in operations
+            ]
+
+    def _execute(self, request, query, variables, operation_name, view=None):
+        body, status_code = (view or self.view).execute_operation(request, query, variables, operation_name)
+        body = body or {}
+        return GraphQLResponse(status_code, body.get('data'), body.get('errors'))
+
+
+class HTTPTransport:
+    """
+    Posts operations to a running endpoint.
+
+    One pooled keep-alive session is shared by every operation. Request
+    bodies over GZIP_THRESHOLD bytes are gzip-compressed, and compressed
+    responses are accepted. Failed attempts are retried up to ``retries``
+    times with jittered exponential backoff. Queries are retried on any
+    connection error, timeout or 502/503/504. Mutations are not
+    idempotent, so they are retried only when the connection could not be
+    established or the server answered 503.
+    """
+
+    def __init__(self, url=None, batch_url=None, retries=None, timeout=None, pool_size=DEFAULT_POOL_SIZE):
+        self.url = url or getattr(settings, 'CRM_GRAPHQL_URL', DEFAULT_URL)
+        self.batch_url = batch_url or getattr(settings, 'CRM_GRAPHQL_BATCH_URL', DEFAULT_BATCH_URL)
+        self.retries = getattr(settings, 'CRM_GRAPHQL_HTTP_RETRIES', DEFAULT_RETRIES) if retries is None else retries
+        self.timeout = timeout or getattr(settings, 'CRM_GRAPHQL_HTTP_TIMEOUT', DEFAULT_TIMEOUT)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip',
+        })
+
+    def execute(self, query, variables=None, operation_name=None, timeout=None):
+        status_code, body = self._post(
+            self.url,
+            _payload(query, variables, operation_name),
+            timeout,
+            idempotent=_is_query(query, operation_name),
+        )
+        if not isinstance(body, dict):
+            raise GraphQLTransportError("GraphQL endpoint returned an unexpected body")
+        return GraphQLResponse(status_code, body.get('data'), body.get('errors'))
+
+    def execute_batch(self, operations, timeout=None):
+        operations = [Operation(*operation) for operation in operations]
+        status_code, body = self._post(
+            self.batch_url,
+            [_payload(*operation) for operation in operations],
+            timeout,
+            idempotent=all(_is_query(op.query, op.operation_name) for op in operations),
+        )
+        if not isinstance(body, list) or len(body) != len(operations):
+            # Errors that reject the whole batch come back as one object
+            errors = body.get('errors') if isinstance(body, dict) else None
+            raise GraphQLTransportError(f"Batch rejected with status {status_code}: {errors}")
+        return [
+            GraphQLResponse(entry.get('status', status_code), entry.get('data'), entry.get('errors'))
+            for entry in body
+        ]
+
+    def _post(self, url, payload, timeout, idempotent):
+        data = json.dumps(payload).encode()
+        headers = {}
+        if len(data) > GZIP_THRESHOLD:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    url,
+                    data=data,
+                    headers=headers,
+                    timeout=(CONNECT_TIMEOUT, timeout or self.timeout),
+                )
+            except requests.exceptions.RequestException as e:
+                if attempt >= self.retries or not _retryable_error(e, idempotent):
+                    raise GraphQLTransportError(str(e)) from e
+            else:
+                retry_statuses = (502, 503, 504) if idempotent else (503,)
+                if response.status_code not in retry_statuses or attempt >= self.retries:
+                    try:
+                        return response.status_code, response.json()
+                    except ValueError:
+                        raise GraphQLTransportError(
+                            f"GraphQL endpoint returned status {response.status_code} without a JSON body"
+                        )
+            # Full jitter keeps retrying jobs from hitting the server in step
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF * 2 ** attempt)))
+            attempt += 1
+
+
+class GraphQLClient:
+    """Runs GraphQL operations through a transport"""
+
+    def __init__(self, transport=None):
+        self.transport = transport or InProcessTransport()
+
+    def execute(self, query, variables=None, operation_name=None, timeout=None):
+        """Run an operation and return a GraphQLResponse"""
+        return self.transport.execute(query, variables, operation_name, timeout=timeout)
+
+    def execute_batch(self, operations, timeout=None):
+        """
+        Run several operations in one round trip. ``operations`` are
+        Operation tuples (or ``(query, variables, operation_name)``);
+        returns one GraphQLResponse per operation, in order.
+        """
+        return self.transport.execute_batch(operations, timeout=timeout)
+
+
+class _DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def _deadline(timeout):
+    """Fail the database queries run after ``timeout`` seconds"""
+    if not timeout:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    expired = False
+
+    def check(execute, sql, params, many, context):
+        nonlocal expired
+        if time.monotonic() > deadline:
+            expired = True
+            raise _DeadlineExceeded(f"Operation exceeded its {timeout}s timeout")
+        return execute(sql, params, many, context)
+
+    try:
+        with connection.execute_wrapper(check):
+            yield
+    except _DeadlineExceeded as e:
+        raise GraphQLTransportError(str(e)) from e
+    # Resolvers report the failed query as a GraphQL error; surface it as a timeout
+    if expired:
+        raise GraphQLTransportError(f"Operation exceeded its {timeout}s timeout")
+
+
+def _request():
+    request = HttpRequest()
+    request.method = 'POST'
+    return request
+
+
+def _payload(query, variables=None, operation_name=None):
+    if query in PERSISTED_QUERIES:
+        # Registered ahead of time; send only the hash
+        payload = persisted_payload(query, variables)
+    else:
+        payload = {'query': query, 'variables': variables}
+    if operation_name:
+        payload['operationName'] = operation_name
+    return payload
+
+
+@lru_cache(maxsize=128)
+def _is_query(query, operation_name=None):
+    """True when the operation is a query, and so safe to send again"""
+    try:
+        operation = get_operation_ast(parse(query), operation_name)
+    except GraphQLError:
+        return False
+    return operation is not None and operation.operation == OperationType.QUERY
+
+
+def _retryable_error(error, idempotent):
+    if idempotent:
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    # Only errors raised before the request reached the server
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(
+        reason, (NewConnectionError, ConnectTimeoutError)
+    )
+
+
+_client = None
+
+
+def get_client():
+    """The process-wide client for CRM_GRAPHQL_TRANSPORT ('inprocess' or 'http')"""
+    global _client
+    if _client is None:
+        transport = getattr(settings, 'CRM_GRAPHQL_TRANSPORT', 'inprocess')
+        if transport == 'http':
+            _client = GraphQLClient(HTTPTransport())
+        elif transport == 'inprocess':
+            _client = GraphQLClient(InProcessTransport())
+        else:
+            raise ValueError(f"Unknown CRM_GRAPHQL_TRANSPORT: {transport!r}")
+    return _client
@@ -0,0 +1,174 @@
+"""
+Static cost analysis of GraphQL operations
+
+The back-references on the CRM types (Customer.orders, Order.products,
+Product.orderSet, ...) let one query fan out multiplicatively. Before an
+operation runs, its cost is estimated from the document alone:
+
+* every object a field can return costs 1, scalars are free;
+* the ``edges`` and ``node`` wrappers of a connection are free, so a
+  connection row costs the same as a row of a plain list;
+* the cost of an object field is multiplied by the number of rows it can
+  return: ``first``/``last`` for connections (capped at
+  RELAY_CONNECTION_MAX_LIMIT), the connection limit when neither is given,
+  and CRM_GRAPHQL_DEFAULT_LIST_SIZE for plain lists.
+
+Operations whose cost exceeds CRM_GRAPHQL_MAX_COST, or whose selection is
+nested deeper than CRM_GRAPHQL_MAX_DEPTH, are rejected without executing.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    InlineFragmentNode,
+    get_named_type,
+    get_nullable_type,
+    is_list_type,
+    value_from_ast,
+)
+from graphql.pyutils import Undefined
+from graphql.utilities import get_operation_ast
+
+
+DEFAULT_MAX_COST = 2000000
+DEFAULT_MAX_DEPTH = 15
+DEFAULT_LIST_SIZE = 100
+
+OBJECT_COST = 1
+
+
+QueryCost = namedtuple('QueryCost', ['cost', 'depth'])
+
+
+def operation_cost(schema, document, operation_name=None, variables=None):
+    """Return the QueryCost of an operation, or None if it cannot be found"""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return None
+    root_type = schema.get_root_type(operation.operation)
+    if root_type is None:
+        return None
+
+    walker = _CostWalker(schema, document, variables or {})
+    cost = walker.selection_set_cost(root_type, operation.selection_set, depth=1)
+    return QueryCost(cost=cost, depth=walker.max_depth)
+
+
+def check_budget(query_cost):
+    """Return a GraphQLError when ``query_cost`` is over the configured budget"""
+    max_depth = getattr(settings, 'CRM_GRAPHQL_MAX_DEPTH', DEFAULT_MAX_DEPTH)
+    if max_depth is not None and query_cost.depth > max_depth:
+        return GraphQLError(
+            f"Query depth {query_cost.depth} exceeds the maximum depth of {max_depth}."
+        )
+
+    max_cost = getattr(settings, 'CRM_GRAPHQL_MAX_COST', DEFAULT_MAX_COST)
+    if max_cost is not None and query_cost.cost > max_cost:
+        return GraphQLError(
+            f"Query cost {query_cost.cost} exceeds the maximum cost of {max_cost}."
+        )
+    return None
+
+
+def cost_extension(query_cost):
+    """The ``extensions.cost`` entry reported with a response"""
+    return {
+        'requested': query_cost.cost,
+        'maximum': getattr(settings, 'CRM_GRAPHQL_MAX_COST', DEFAULT_MAX_COST),
+        'depth': query_cost.depth,
+    }
+
+
+class _CostWalker:
+
+    def __init__(self, schema, document, variables):
+        self.schema = schema
+        self.variables = variables
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.max_depth = 0
+
+    def selection_set_cost(self, parent_type, selection_set, depth):
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                total += self.field_cost(parent_type, selection, depth)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is not None:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                    total += self.selection_set_cost(fragment_type, fragment.selection_set, depth)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                total += self.selection_set_cost(fragment_type, selection.selection_set, depth)
+        return total
+
+    def field_cost(self, parent_type, node, depth):
+        self.max_depth = max(self.max_depth, depth)
+
+        fields = getattr(parent_type, 'fields', None) or {}
+        field = fields.get(node.name.value)
+        if field is None or node.selection_set is None:
+            # Scalars, enums and introspection fields
+            return 0
+
+        rows = self.row_count(parent_type, field, node)
+        children = self.selection_set_cost(get_named_type(field.type), node.selection_set, depth + 1)
+        if _is_wrapper(parent_type, node):
+            return rows * children
+        return rows * (OBJECT_COST + children)
+
+    def row_count(self, parent_type, field, node):
+        if _is_connection(parent_type) and node.name.value == 'edges':
+            # Already counted on the connection field itself
+            return 1
+
+        max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        if _is_connection(get_named_type(field.type)):
+            requested = [
+                value for value in (self.argument(field, node, 'first'), self.argument(field, node, 'last'))
+                if isinstance(value, int)
+            ]
+            if not requested:
+                return max_limit or DEFAULT_LIST_SIZE
+            rows = max(max(requested), 0)
+            return min(rows, max_limit) if max_limit else rows
+
+        if is_list_type(get_nullable_type(field.type)):
+            return getattr(settings, 'CRM_GRAPHQL_DEFAULT_LIST_SIZE', DEFAULT_LIST_SIZE)
+        return 1
+
+    def argument(self, field, node, name):
+        argument_type = field.args.get(name)
+        if argument_type is None:
+            return None
+        for argument in node.arguments:
+            if argument.name.value == name:
+                value = value_from_ast(argument.value, argument_type.type, self.variables)
+                return None if value is Undefined else value
+        return None
+
+
+def _is_wrapper(parent_type, node):
+    """True for the ``edges`` of a connection and the ``node`` of an edge"""
+    name = node.name.value
+    if name == 'edges':
+        return _is_connection(parent_type)
+    fields = getattr(parent_type, 'fields', None) or {}
+    return name == 'node' and 'cursor' in fields
+
+
+def _is_connection(graphql_type):
+    fields = getattr(graphql_type, 'fields', None) or {}
+    return 'edges' in fields and 'pageInfo' in fields
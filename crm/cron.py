@@ -5,7 +5,10 @@ Cron jobs for the CRM application
 import os
 import sys
 from datetime import datetime
-import requests
+
+from crm.client import GraphQLClient, GraphQLTransportError, HTTPTransport, get_client
+from crm.queries import HEARTBEAT_QUERY, UPDATE_LOW_STOCK_MUTATION
+
 
 def log_crm_heartbeat():
     """
@@ -23,16 +26,12 @@ def log_crm_heartbeat():
         
         # Optionally query the GraphQL hello field to verify endpoint is responsive
         try:
-            response = requests.post(
-                'http://localhost:8000/graphql/',
-                json={'query': '{ hello }'},
-                headers={'Content-Type': 'application/json'},
-                timeout=5
-            )
+            # Check the endpoint itself, whatever CRM_GRAPHQL_TRANSPORT is; a
+            # health check should fail fast rather than wait out the default timeout
+            response = GraphQLClient(HTTPTransport()).execute(HEARTBEAT_QUERY, timeout=5)
             
             if response.status_code == 200:
-                data = response.json()
-                if data.get('data', {}).get('hello'):
+                if (response.data or {}).get('hello'):
                     # Log successful GraphQL query
                     graphql_log = f"{timestamp} GraphQL endpoint is responsive\n"
                     with open('/tmp/crm_heartbeat_log.txt', 'a') as f:
@@ -48,7 +47,7 @@ def log_crm_heartbeat():
                 with open('/tmp/crm_heartbeat_log.txt', 'a') as f:
                     f.write(graphql_log)
                     
-        except requests.exceptions.RequestException as e:
+        except GraphQLTransportError as e:
             # Log GraphQL connection error
             graphql_log = f"{timestamp} GraphQL endpoint connection error: {str(e)}\n"
             with open('/tmp/crm_heartbeat_log.txt', 'a') as f:
@@ -74,33 +73,11 @@ def update_low_stock():
     and log updated product names and new stock levels
     """
     try:
-        # GraphQL mutation to update low stock products
-        mutation = """
-        mutation UpdateLowStockProducts {
-            updateLowStockProducts {
-                updatedProducts {
-                    id
-                    name
-                    stock
-                    price
-                }
-                successMessage
-                errors
-            }
-        }
-        """
-        
-        # Make GraphQL request
-        response = requests.post(
-            'http://localhost:8000/graphql/',
-            json={'query': mutation},
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
+        # Run the mutation in-process (or over HTTP, see crm/client.py)
+        response = get_client().execute(UPDATE_LOW_STOCK_MUTATION, timeout=60)
         
         if response.status_code == 200:
-            data = response.json()
-            result = data.get('data', {}).get('updateLowStockProducts', {})
+            result = (response.data or {}).get('updateLowStockProducts') or {}
             
             if result.get('errors'):
                 # Log errors
@@ -136,7 +113,7 @@ def update_low_stock():
                 f.write(error_log)
             return False
             
-    except requests.exceptions.RequestException as e:
+    except GraphQLTransportError as e:
         # Log connection error
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         error_log = f"{timestamp} - Connection error: {str(e)}\n"
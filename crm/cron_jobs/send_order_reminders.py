@@ -6,13 +6,11 @@ Queries GraphQL endpoint for orders within the last 7 days and logs reminders
 
 import os
 import sys
-from datetime import datetime, timedelta
-import requests
-import json
+from datetime import timedelta
 
-# Add the project directory to Python path
+# Add the project directory (two levels up from crm/cron_jobs) to Python path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
+PROJECT_DIR = os.path.dirname(os.path.dirname(SCRIPT_DIR))
 sys.path.insert(0, PROJECT_DIR)
 
 # Django setup
@@ -21,7 +19,12 @@ import django
 django.setup()
 
 from django.utils import timezone
-from crm.models import Order
+
+from crm.client import GraphQLTransportError, get_client
+from crm.queries import RECENT_ORDERS_QUERY
+
+PAGE_SIZE = 100
+
 
 def send_order_reminders():
     """Query orders from the last 7 days and log reminders"""
@@ -29,73 +32,54 @@ def send_order_reminders():
     # Calculate date 7 days ago
     seven_days_ago = timezone.now() - timedelta(days=7)
     
-    # GraphQL query to get orders from the last 7 days
-    query = """
-    query GetRecentOrders($since: DateTime!) {
-        allOrders {
-            id
-            orderDate
-            totalAmount
-            customer {
-                id
-                name
-                email
-            }
-        }
-    }
-    """
-    
-    # Variables for the GraphQL query
-    variables = {
-        "since": seven_days_ago.isoformat()
-    }
-    
     try:
-        # Make GraphQL request
-        response = requests.post(
-            'http://localhost:8000/graphql/',
-            json={
-                'query': query,
-                'variables': variables
-            },
-            headers={'Content-Type': 'application/json'}
-        )
+        timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
+        processed = 0
+        after = None
         
-        if response.status_code == 200:
-            data = response.json()
-            orders = data.get('data', {}).get('allOrders', [])
-            
-            # Filter orders from the last 7 days (in case GraphQL filtering doesn't work)
-            recent_orders = []
-            for order in orders:
-                order_date = datetime.fromisoformat(order['orderDate'].replace('Z', '+00:00'))
-                if order_date >= seven_days_ago:
-                    recent_orders.append(order)
-            
-            # Log the reminders
-            timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_message = f"{timestamp} - Processing {len(recent_orders)} recent orders\n"
-            
-            for order in recent_orders:
-                customer_email = order['customer']['email']
-                order_id = order['id']
-                total_amount = order['totalAmount']
+        with open('/tmp/order_reminders_log.txt', 'a') as f:
+            while True:
+                # Fetch the next page (in-process or over HTTP, see crm/client.py)
+                response = get_client().execute(RECENT_ORDERS_QUERY, {
+                    'since': seven_days_ago.isoformat(),
+                    'first': PAGE_SIZE,
+                    'after': after,
+                }, timeout=30)
+                
+                if response.status_code != 200:
+                    print(f"GraphQL request failed with status code: {response.status_code}")
+                    return processed
+                
+                if response.errors:
+                    print(f"GraphQL errors: {response.errors}")
+                    return processed
+                
+                connection = response.data['ordersSince']
+                
+                # Log the reminders for this page
+                log_message = ""
+                for edge in connection['edges']:
+                    order = edge['node']
+                    customer_email = order['customer']['email']
+                    order_id = order['id']
+                    total_amount = order['totalAmount']
+                    
+                    reminder_line = f"{timestamp} - Order {order_id}: Customer {customer_email}, Amount: ${total_amount}\n"
+                    log_message += reminder_line
                 
-                reminder_line = f"{timestamp} - Order {order_id}: Customer {customer_email}, Amount: ${total_amount}\n"
-                log_message += reminder_line
-            
-            # Write to log file
-            with open('/tmp/order_reminders_log.txt', 'a') as f:
                 f.write(log_message)
+                processed += len(connection['edges'])
+                
+                if not connection['pageInfo']['hasNextPage']:
+                    break
+                after = connection['pageInfo']['endCursor']
             
-            print(f"Order reminders processed! Found {len(recent_orders)} recent orders.")
-            return len(recent_orders)
-            
-        else:
-            print(f"GraphQL request failed with status code: {response.status_code}")
-            return 0
+            f.write(f"{timestamp} - Processed {processed} recent orders\n")
+        
+        print(f"Order reminders processed! Found {processed} recent orders.")
+        return processed
             
-    except requests.exceptions.ConnectionError:
+    except GraphQLTransportError:
         print("Could not connect to GraphQL endpoint. Make sure the server is running on localhost:8000")
         return 0
     except Exception as e:
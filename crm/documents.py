@@ -0,0 +1,152 @@
+"""
+Parsed-and-validated GraphQL document cache and persisted queries
+
+Parsing and validating a query costs more than running the SQL behind the
+small queries the CRM clients send, so documents are cached in an LRU keyed
+by the SHA-256 hash of the query text, together with their validation
+errors.
+
+Clients may send only the hash of a query in
+``extensions.persistedQuery.sha256Hash`` (the automatic persisted query
+protocol). The queries in crm/queries.py are registered ahead of time;
+others are registered the first time a client sends the text along with
+its hash. With CRM_GRAPHQL_PERSISTED_ONLY only the pre-registered queries
+are accepted.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import parse, validate
+
+
+DEFAULT_CACHE_SIZE = 500
+
+
+class PersistedQueryError(Exception):
+    """A persisted query request that must be rejected"""
+
+
+class PersistedQueryNotFound(PersistedQueryError):
+    """The hash is unknown; the client should retry with the query text"""
+
+    def __init__(self):
+        super().__init__('PersistedQueryNotFound')
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class Document:
+    """A parsed document, its validation errors and derived data"""
+
+    def __init__(self, ast, errors):
+        self.ast = ast
+        self.errors = errors
+        # Per-operation data computed from the document, e.g. cache plans
+        self.plans = {}
+
+
+class LRU:
+    """Thread-safe mapping that keeps the ``maxsize`` most recently used keys"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _cache_size():
+    return getattr(settings, 'CRM_GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+
+_documents = LRU(_cache_size())
+_registered = LRU(_cache_size())
+_pinned = None
+
+
+def get_document(schema, query, validation_rules=None):
+    """Return the cached Document for ``query``, parsing and validating it once"""
+    rules = tuple(validation_rules or ())
+    key = (schema, rules, query_hash(query))
+    document = _documents.get(key)
+    if document is not None:
+        return document
+
+    try:
+        ast = parse(query)
+    except Exception as e:
+        document = Document(None, [e])
+    else:
+        errors = validate(schema, ast, rules or None, graphene_settings.MAX_VALIDATION_ERRORS)
+        document = Document(ast, errors)
+    _documents.set(key, document)
+    return document
+
+
+def pinned_queries():
+    """Hash -> text of the queries registered ahead of time in crm/queries.py"""
+    global _pinned
+    if _pinned is None:
+        from .queries import PERSISTED_QUERIES
+
+        _pinned = {query_hash(query): query for query in PERSISTED_QUERIES}
+    return _pinned
+
+
+def resolve_query(query, extensions):
+    """
+    Return the query text to execute for a request carrying ``query``
+    and/or a persisted query hash in ``extensions``.
+    """
+    locked = getattr(settings, 'CRM_GRAPHQL_PERSISTED_ONLY', False)
+    persisted = (extensions or {}).get('persistedQuery') or {}
+    sha256 = persisted.get('sha256Hash')
+
+    if not sha256:
+        if locked and query and query_hash(query) not in pinned_queries():
+            raise PersistedQueryError('Only persisted queries are accepted')
+        return query
+
+    if query:
+        if query_hash(query) != sha256:
+            raise PersistedQueryError('provided sha does not match query')
+        if locked and sha256 not in pinned_queries():
+            raise PersistedQueryError('Unknown persisted query')
+        if sha256 not in pinned_queries():
+            _registered.set(sha256, query)
+        return query
+
+    query = pinned_queries().get(sha256)
+    if query is None and not locked:
+        query = _registered.get(sha256)
+    if query is None:
+        if locked:
+            raise PersistedQueryError('Unknown persisted query')
+        raise PersistedQueryNotFound()
+    return query
@@ -0,0 +1,152 @@
+"""
+Bulk CSV/NDJSON exports of the CRM tables
+
+Rows are read straight from ``values_list`` in primary-key order, one
+keyset batch at a time (``pk > last exported pk``), and written out as each
+batch arrives, so memory stays constant however many rows are exported.
+The primary key is always the first column; the last one written is the
+cursor to resume an interrupted export from (``after``).
+"""
+
+import csv
+import io
+import json
+import zlib
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+
+from .filters import CustomerFilter, OrderFilter, OrderItemFilter, ProductFilter
+from .models import Customer, Order, OrderItem, Product
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+Export = namedtuple('Export', ['model', 'filterset_class', 'columns'])
+
+EXPORTS = {
+    'customers': Export(Customer, CustomerFilter, (
+        'id', 'name', 'email', 'phone', 'order_count', 'lifetime_value',
+        'last_order_date', 'created_at',
+    )),
+    'products': Export(Product, ProductFilter, (
+        'id', 'name', 'price', 'stock', 'created_at',
+    )),
+    'orders': Export(Order, OrderFilter, (
+        'id', 'customer_id', 'total_amount', 'order_date', 'created_at',
+    )),
+    'order_items': Export(OrderItem, OrderItemFilter, (
+        'id', 'order_id', 'product_id', 'quantity', 'price',
+    )),
+}
+
+
+class ExportError(Exception):
+    """Raised for an unknown export, format or invalid filters"""
+
+
+class Exporter:
+    """
+    Iterates over the encoded rows of one export. ``rows`` and ``cursor``
+    report progress, so an interrupted export can be resumed with
+    ``after=cursor``.
+    """
+
+    def __init__(self, name, format='csv', filters=None, after=None, batch_size=None, header=True):
+        if name not in EXPORTS:
+            raise ExportError(f"Unknown export '{name}'; choose from {', '.join(EXPORTS)}")
+        if format not in FORMATS:
+            raise ExportError(f"Unknown format '{format}'; choose from {', '.join(FORMATS)}")
+
+        export = EXPORTS[name]
+        filterset = export.filterset_class(data=filters or {}, queryset=export.model.objects.all())
+        if not filterset.is_valid():
+            raise ExportError(f"Invalid filters: {dict(filterset.errors)}")
+
+        self.name = name
+        self.format = format
+        self.columns = export.columns
+        self.queryset = filterset.qs
+        self.batch_size = batch_size or getattr(settings, 'CRM_EXPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.header = header
+        self.rows = 0
+        self.cursor = after
+
+    @property
+    def content_type(self):
+        return FORMATS[self.format]
+
+    @property
+    def filename(self):
+        return f"{self.name}.{self.format}"
+
+    def batches(self):
+        """Yield lists of row tuples in primary-key order"""
+        queryset = self.queryset.order_by('pk').values_list(*self.columns)
+        while True:
+            page = queryset
+            if self.cursor is not None:
+                page = page.filter(pk__gt=self.cursor)
+            batch = list(page[:self.batch_size])
+            if not batch:
+                return
+            yield batch
+            self.rows += len(batch)
+            self.cursor = batch[-1][0]
+
+    def __iter__(self):
+        if self.format == 'csv':
+            return self._csv()
+        return self._ndjson()
+
+    def _csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self.header:
+            writer.writerow(self.columns)
+        for batch in self.batches():
+            writer.writerows([_csv_value(value) for value in row] for row in batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    def _ndjson(self):
+        for batch in self.batches():
+            yield ''.join(
+                json.dumps(dict(zip(self.columns, row)), default=_json_default, separators=(',', ':')) + '\n'
+                for row in batch
+            ).encode()
+
+
+def gzip_chunks(chunks):
+    """Compress an iterable of bytes incrementally into a gzip stream"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,192 @@
+"""
+Connection fields used by the CRM GraphQL schema
+"""
+
+import base64
+import json
+from functools import partial
+
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError
+
+from .aio import alist, running_async
+from .optimizer import optimize_queryset
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection that accepts lists already resolved by a DataLoader.
+    Querysets are still passed through the FilterSet as usual.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        if isinstance(iterable, list):
+            return iterable
+        return super().resolve_queryset(connection, iterable, info, args, **kwargs)
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection paginated by keyset instead of OFFSET.
+
+    Rows are sorted by ``ordering`` (which must end with a unique column)
+    and cursors encode the ordering values of a row, so fetching a page
+    is a bounded index range scan however deep into the result it is.
+    Page size is capped by ``max_limit``, which defaults to
+    GRAPHENE['RELAY_CONNECTION_MAX_LIMIT'].
+    """
+
+    def __init__(self, type_, *args, ordering, **kwargs):
+        self.ordering = tuple(ordering)
+        super().__init__(type_, *args, **kwargs)
+        # Offsets cannot be expressed as a keyset
+        self._base_args.pop('offset', None)
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(
+            self.keyset_resolver,
+            self.resolver or parent_resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+            self.ordering,
+        )
+
+    @classmethod
+    def keyset_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        ordering,
+        root,
+        info,
+        **args,
+    ):
+        first = args.get('first')
+        last = args.get('last')
+        after = args.get('after')
+        before = args.get('before')
+
+        if first is not None and last is not None:
+            raise GraphQLError(
+                f"Passing both `first` and `last` to paginate the `{info.field_name}` "
+                f"connection is not supported."
+            )
+        for name, value in (('first', first), ('last', last)):
+            if value is None:
+                continue
+            if value < 0:
+                raise GraphQLError(f"Argument `{name}` on `{info.field_name}` cannot be negative.")
+            if max_limit and value > max_limit:
+                raise GraphQLError(
+                    f"Requesting {value} records on the `{info.field_name}` connection "
+                    f"exceeds the `{name}` limit of {max_limit} records."
+                )
+
+        queryset = resolver(root, info, **args)
+        if queryset is None:
+            queryset = default_manager
+        queryset = queryset_resolver(connection, queryset, info, args)
+
+        fields = [name.lstrip('-') for name in ordering]
+        model = queryset.model
+        queryset = optimize_queryset(queryset, info, extra_fields=fields)
+
+        if after:
+            queryset = queryset.filter(_keyset_q(ordering, decode_cursor(after, model, fields), forward=True))
+        if before:
+            queryset = queryset.filter(_keyset_q(ordering, decode_cursor(before, model, fields), forward=False))
+
+        backwards = last is not None
+        limit = last if backwards else (first if first is not None else max_limit)
+
+        if backwards:
+            queryset = queryset.order_by(*[_reverse(name) for name in ordering])
+        else:
+            queryset = queryset.order_by(*ordering)
+
+        if limit is not None:
+            queryset = queryset[:limit + 1]
+
+        if running_async():
+            return cls._async_page(queryset, connection, fields, limit, backwards, after, before)
+        return cls._page(list(queryset), connection, fields, limit, backwards, after, before)
+
+    @classmethod
+    async def _async_page(cls, queryset, connection, fields, limit, backwards, after, before):
+        nodes = await alist(queryset)
+        return cls._page(nodes, connection, fields, limit, backwards, after, before)
+
+    @staticmethod
+    def _page(nodes, connection, fields, limit, backwards, after, before):
+        """Build the connection from up to ``limit + 1`` fetched rows"""
+        has_more = limit is not None and len(nodes) > limit
+        if has_more:
+            nodes = nodes[:limit]
+
+        if backwards:
+            nodes.reverse()
+
+        edges = [
+            connection.Edge(node=node, cursor=encode_cursor(node, fields))
+            for node in nodes
+        ]
+        page_info = PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_more if backwards else bool(after),
+            has_next_page=bool(before) if backwards else has_more,
+        )
+        return connection(edges=edges, page_info=page_info)
+
+
+def encode_cursor(instance, fields):
+    """Encode the ordering values of a row as an opaque cursor"""
+    values = []
+    for name in fields:
+        value = getattr(instance, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, model, fields):
+    """Decode a cursor into ordering values typed for ``model``"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(fields):
+            raise ValueError
+        return [
+            model._meta.get_field(name).to_python(value)
+            for name, value in zip(fields, values)
+        ]
+    except Exception:
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def _reverse(name):
+    return name[1:] if name.startswith('-') else '-' + name
+
+
+def _keyset_q(ordering, values, forward):
+    """
+    Build the row-value comparison that selects rows strictly after
+    (``forward``) or before the row the cursor points at.
+    """
+    condition = Q()
+    for index, name in enumerate(ordering):
+        field = name.lstrip('-')
+        descending = name.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+
+        term = Q(**{f'{field}__{lookup}': values[index]})
+        for previous, value in zip(ordering[:index], values):
+            term &= Q(**{previous.lstrip('-'): value})
+        condition |= term
+    return condition
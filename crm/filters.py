@@ -1,6 +1,6 @@
 import django_filters
 from django_filters import rest_framework
-from .models import Customer, Product, Order
+from .models import Customer, Product, Order, OrderItem
 
 
 class CustomerFilter(django_filters.FilterSet):
@@ -8,11 +8,16 @@ class CustomerFilter(django_filters.FilterSet):
     email = django_filters.CharFilter(lookup_expr='icontains')
     created_at__gte = django_filters.DateFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateFilter(field_name='created_at', lookup_expr='lte')
+    last_order_date__gte = django_filters.DateFilter(field_name='last_order_date', lookup_expr='gte')
+    last_order_date__lte = django_filters.DateFilter(field_name='last_order_date', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern']
+        fields = [
+            'name', 'email', 'created_at__gte', 'created_at__lte',
+            'last_order_date__gte', 'last_order_date__lte', 'phone_pattern',
+        ]
 
     def filter_phone_pattern(self, queryset, name, value):
         """Custom filter for phone number pattern (e.g., starts with +1)"""
@@ -46,8 +51,8 @@ class OrderFilter(django_filters.FilterSet):
     order_date__gte = django_filters.DateFilter(field_name='order_date', lookup_expr='gte')
     order_date__lte = django_filters.DateFilter(field_name='order_date', lookup_expr='lte')
     customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
-    product_id = django_filters.NumberFilter(field_name='products__id')
+    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains', distinct=True)
+    product_id = django_filters.NumberFilter(field_name='products__id', distinct=True)
 
     class Meta:
         model = Order
@@ -56,3 +61,14 @@ class OrderFilter(django_filters.FilterSet):
             'order_date__gte', 'order_date__lte',
             'customer_name', 'product_name', 'product_id'
         ]
+
+
+class OrderItemFilter(django_filters.FilterSet):
+    order_id = django_filters.NumberFilter(field_name='order_id')
+    product_id = django_filters.NumberFilter(field_name='product_id')
+    order_date__gte = django_filters.DateFilter(field_name='order__order_date', lookup_expr='gte')
+    order_date__lte = django_filters.DateFilter(field_name='order__order_date', lookup_expr='lte')
+
+    class Meta:
+        model = OrderItem
+        fields = ['order_id', 'product_id', 'order_date__gte', 'order_date__lte']
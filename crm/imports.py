@@ -0,0 +1,398 @@
+"""
+Streaming CSV/NDJSON imports of customers, products and orders
+
+Files are read and loaded ``chunk_size`` rows at a time, so memory stays
+constant however large the file is. Every row is validated with the rules
+the mutations use (email uniqueness, the phone pattern, positive prices);
+rows that fail are handed back as ``Reject`` objects instead of aborting
+the import. Each chunk is written with one ``bulk_create`` under its own
+transaction.
+
+``on_conflict`` controls rows whose key already exists (a customer's
+email, or a product's ``id`` when the file provides one):
+
+* ``error``: reject them, like CreateCustomer does;
+* ``ignore``: skip them (``bulk_create(ignore_conflicts=True)``);
+* ``update``: overwrite them (``bulk_create(update_conflicts=True)``).
+
+Orders have no natural key and are always inserted. They reference
+customers by ``customer_id`` or ``customer_email`` and products by
+``product_ids`` (``;``-separated in CSV); both are resolved through
+in-memory maps that are filled one query per chunk. Imported orders are
+historical data, so no stock is reserved for them.
+"""
+
+import csv
+import json
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.color import no_style
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bulk import chunked, existing_emails, get_chunk_size
+from .models import Customer, Order, OrderItem, Product
+from .orders import OrderError, build_order, merge_lines
+from .rollups import record_orders
+from .validators import is_valid_phone
+
+
+FORMATS = ('csv', 'ndjson')
+CONFLICT_MODES = ('error', 'ignore', 'update')
+
+# Entries kept in each foreign key map before it is cleared
+MAP_LIMIT = 100000
+
+
+Reject = namedtuple('Reject', ['line', 'row', 'reason'])
+
+
+class ImportFailed(Exception):
+    """Raised for an unknown table, format, conflict mode or chunk size"""
+
+
+def read_rows(stream, format):
+    """
+    Yield ``(line, row)`` pairs from a text stream. Rows that cannot be
+    parsed are yielded with ``row`` set to None.
+    """
+    if format not in FORMATS:
+        raise ImportFailed(f"Unknown format '{format}'; choose from {', '.join(FORMATS)}")
+
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        yield line, row if isinstance(row, dict) else None
+
+
+class Importer:
+    """
+    Loads one table from ``(line, row)`` pairs. ``read``, ``written``,
+    ``skipped`` (existing rows left alone by ``on_conflict='ignore'``) and
+    ``rejected`` count rows as they are processed.
+    """
+
+    def __init__(self, table, on_conflict='error', chunk_size=None):
+        loaders = {
+            'customers': self._import_customers,
+            'products': self._import_products,
+            'orders': self._import_orders,
+        }
+        if table not in loaders:
+            raise ImportFailed(f"Unknown table '{table}'; choose from {', '.join(loaders)}")
+        if on_conflict not in CONFLICT_MODES:
+            raise ImportFailed(f"Unknown conflict mode '{on_conflict}'; choose from {', '.join(CONFLICT_MODES)}")
+
+        self.table = table
+        self.on_conflict = on_conflict
+        try:
+            self.chunk_size = get_chunk_size(chunk_size)
+        except ValueError as e:
+            raise ImportFailed(str(e))
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.rejected = 0
+        self._load = loaders[table]
+        self._customer_emails = {}
+        self._customer_ids = set()
+        self._product_map = {}
+        self._explicit_ids = False
+
+    def run(self, rows, on_reject=None):
+        """Import ``rows``; ``on_reject`` is called with every Reject"""
+        chunk = []
+        for line, row in rows:
+            chunk.append((line, row))
+            if len(chunk) == self.chunk_size:
+                self._run_chunk(chunk, on_reject)
+                chunk = []
+        if chunk:
+            self._run_chunk(chunk, on_reject)
+        self._reset_sequences()
+
+    def _run_chunk(self, chunk, on_reject):
+        self.read += len(chunk)
+        rejects = []
+        valid = []
+        for line, row in chunk:
+            if row is None:
+                rejects.append(Reject(line, row, "Row could not be parsed"))
+            else:
+                valid.append((line, row))
+
+        try:
+            with transaction.atomic():
+                written, skipped = self._load(valid, rejects)
+            self.written += written
+            self.skipped += skipped
+        except DatabaseError as e:
+            rejected = {reject.line for reject in rejects}
+            rejects.extend(
+                Reject(line, row, str(e)) for line, row in valid if line not in rejected
+            )
+
+        self.rejected += len(rejects)
+        if on_reject is not None:
+            for reject in sorted(rejects, key=lambda reject: reject.line):
+                on_reject(reject)
+
+    # Tables
+
+    def _import_customers(self, chunk, rejects):
+        name_length = Customer._meta.get_field('name').max_length
+        email_length = Customer._meta.get_field('email').max_length
+        phone_length = Customer._meta.get_field('phone').max_length
+        customers = {}
+
+        for line, row in chunk:
+            name = _text(row, 'name')
+            email = _text(row, 'email')
+            phone = _text(row, 'phone')
+            if not name or not email:
+                reason = "Name and email are required"
+            elif email in customers:
+                reason = "Email already exists"
+            elif phone and not is_valid_phone(phone):
+                reason = "Invalid phone number format"
+            elif len(name) > name_length or len(email) > email_length or len(phone) > phone_length:
+                reason = "Value too long"
+            else:
+                customers[email] = (line, row, Customer(name=name, email=email, phone=phone))
+                continue
+            rejects.append(Reject(line, row, reason))
+
+        skipped = 0
+        if self.on_conflict != 'update':
+            for email in existing_emails(customers, self.chunk_size):
+                line, row, _ = customers.pop(email)
+                if self.on_conflict == 'error':
+                    rejects.append(Reject(line, row, "Email already exists"))
+                else:
+                    skipped += 1
+
+        objects = [customer for _, _, customer in customers.values()]
+        self._bulk_create(Customer, objects, unique_fields=['email'], update_fields=['name', 'phone', 'updated_at'])
+        return len(objects), skipped
+
+    def _import_products(self, chunk, rejects):
+        name_length = Product._meta.get_field('name').max_length
+        products = {}
+        pending = []
+
+        for line, row in chunk:
+            name = _text(row, 'name')
+            try:
+                price = Decimal(_text(row, 'price'))
+            except InvalidOperation:
+                price = None
+            stock = _integer(row, 'stock', default=0)
+            product_id = _integer(row, 'id')
+
+            if not name:
+                reason = "Name is required"
+            elif len(name) > name_length:
+                reason = "Value too long"
+            elif price is None or not price.is_finite() or price <= 0:
+                reason = "Price must be positive"
+            elif stock is False:
+                reason = "Stock must be an integer"
+            elif stock < 0:
+                reason = "Stock cannot be negative"
+            elif product_id is False or (product_id is not None and product_id in products):
+                reason = "Invalid product ID"
+            else:
+                product = Product(id=product_id, name=name, price=price.quantize(Decimal('0.01')), stock=stock)
+                if product_id is None:
+                    pending.append(product)
+                else:
+                    products[product_id] = (line, row, product)
+                continue
+            rejects.append(Reject(line, row, reason))
+
+        skipped = 0
+        if products:
+            self._explicit_ids = True
+            if self.on_conflict != 'update':
+                taken = Product.objects.filter(pk__in=list(products)).values_list('pk', flat=True)
+                for product_id in list(taken):
+                    line, row, _ = products.pop(product_id)
+                    if self.on_conflict == 'error':
+                        rejects.append(Reject(line, row, "Product ID already exists"))
+                    else:
+                        skipped += 1
+            pending.extend(product for _, _, product in products.values())
+
+        self._bulk_create(Product, pending, unique_fields=['id'], update_fields=['name', 'price', 'stock', 'updated_at'])
+        return len(pending), skipped
+
+    def _import_orders(self, chunk, rejects):
+        parsed = []
+        for line, row in chunk:
+            try:
+                customer = _customer_key(row)
+                lines = merge_lines(_list(row, 'product_ids'), _quantities(row))
+                order_date = _datetime(row, 'order_date')
+            except (OrderError, ValueError) as e:
+                rejects.append(Reject(line, row, str(e)))
+                continue
+            parsed.append((line, row, customer, lines, order_date))
+
+        self._fill_maps(parsed)
+
+        orders = []
+        items = []
+        for line, row, customer, lines, order_date in parsed:
+            if isinstance(customer, str):
+                customer_id = self._customer_emails.get(customer)
+            else:
+                customer_id = customer if customer in self._customer_ids else None
+            if customer_id is None:
+                rejects.append(Reject(line, row, "Invalid customer ID"))
+                continue
+            missing = [product_id for product_id in lines if product_id not in self._product_map]
+            if missing:
+                rejects.append(Reject(line, row, f"Invalid product ID: {missing[0]}"))
+                continue
+            order, order_items = build_order(None, lines, self._product_map)
+            order.customer_id = customer_id
+            orders.append((order, order_items, order_date))
+
+        created = Order.objects.bulk_create([order for order, _, _ in orders])
+        dated = []
+        for order, (_, order_items, order_date) in zip(created, orders):
+            for item in order_items:
+                item.order = order
+            items.extend(order_items)
+            if order_date is not None:
+                # auto_now_add overrides the value passed to bulk_create
+                order.order_date = order_date
+                dated.append(order)
+        if dated:
+            Order.objects.bulk_update(dated, ['order_date'])
+        OrderItem.objects.bulk_create(items)
+        # bulk_create sends no post_save signals
+        record_orders(created)
+        return len(created), 0
+
+    # Helpers
+
+    def _bulk_create(self, model, objects, unique_fields, update_fields):
+        for batch in chunked(objects, self.chunk_size):
+            if self.on_conflict == 'ignore':
+                # Existing rows were probed and skipped already; this only
+                # covers rows inserted concurrently since the probe
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            elif self.on_conflict == 'update':
+                model.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=update_fields,
+                )
+            else:
+                model.objects.bulk_create(batch)
+
+    def _fill_maps(self, parsed):
+        """Load the customers and products a chunk refers to into the maps"""
+        for known in (self._customer_emails, self._customer_ids, self._product_map):
+            if len(known) > MAP_LIMIT:
+                known.clear()
+
+        emails = set()
+        customer_ids = set()
+        product_ids = set()
+        for _, _, customer, lines, _ in parsed:
+            if isinstance(customer, str):
+                if customer not in self._customer_emails:
+                    emails.add(customer)
+            elif customer not in self._customer_ids:
+                customer_ids.add(customer)
+            product_ids.update(product_id for product_id in lines if product_id not in self._product_map)
+
+        for batch in chunked(list(emails), self.chunk_size):
+            self._customer_emails.update(Customer.objects.filter(email__in=batch).values_list('email', 'pk'))
+        for batch in chunked(list(customer_ids), self.chunk_size):
+            self._customer_ids.update(Customer.objects.filter(pk__in=batch).values_list('pk', flat=True))
+        for batch in chunked(list(product_ids), self.chunk_size):
+            self._product_map.update(Product.objects.only('pk', 'price').in_bulk(batch))
+
+    def _reset_sequences(self):
+        """Move the id sequence past explicitly imported product ids"""
+        if not self._explicit_ids:
+            return
+        statements = connection.ops.sequence_reset_sql(no_style(), [Product])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _integer(row, key, default=None):
+    """The integer in ``row[key]``, ``default`` when empty, False when invalid"""
+    value = _text(row, key)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return False
+
+
+def _list(row, key):
+    value = row.get(key)
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in _text(row, key).split(';') if item.strip()]
+
+
+def _quantities(row):
+    quantities = _list(row, 'quantities')
+    if not quantities:
+        return None
+    try:
+        return [int(quantity) for quantity in quantities]
+    except (TypeError, ValueError):
+        raise OrderError("Quantities must be integers")
+
+
+def _customer_key(row):
+    """The customer id (int) or email (str) an order row refers to"""
+    customer_id = _integer(row, 'customer_id')
+    if customer_id is False:
+        raise OrderError("Invalid customer ID")
+    if customer_id is not None:
+        return customer_id
+    email = _text(row, 'customer_email')
+    if not email:
+        raise OrderError("Invalid customer ID")
+    return email
+
+
+def _datetime(row, key):
+    value = _text(row, key)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {key}: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -0,0 +1,213 @@
+"""
+Per-request DataLoaders for the CRM GraphQL schema
+
+Relation fields on the CRM types (Order.customer, Order.products,
+Customer.orders, ...) would otherwise run one query per row. The loaders
+below collect every key that a list of parent objects will need and load
+each relation with a single ``IN (...)`` query the first time any row asks
+for it.
+
+Nested connections given filter arguments (``orders(totalAmount_Gte: ...)``)
+bypass the loaders and run one filtered query per parent row, since each
+row's filtered queryset is evaluated on its own.
+"""
+
+from collections import defaultdict
+from inspect import isawaitable
+
+from django.db.models import F, Model
+from django.db.models.query import QuerySet
+
+from .models import Customer, Product, Order, OrderItem
+
+
+class DataLoader:
+    """
+    Synchronous batching loader.
+
+    Keys are queued with ``enqueue`` while parent objects are being
+    resolved; the first ``load`` that misses the cache dispatches every
+    queued key in one call to ``batch_load_fn``.
+    """
+
+    def __init__(self, batch_load_fn):
+        self.batch_load_fn = batch_load_fn
+        self._cache = {}
+        self._queue = {}
+
+    def enqueue(self, keys):
+        """Queue keys for the next batch without loading them"""
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._queue[key] = None
+
+    def prime(self, key, value):
+        """Store a value that is already known"""
+        self._cache.setdefault(key, value)
+        self._queue.pop(key, None)
+
+    def load(self, key):
+        if key is None:
+            return None
+        if key not in self._cache:
+            self._queue[key] = None
+            self.dispatch()
+        return self._cache[key]
+
+    def load_many(self, keys):
+        self.enqueue(keys)
+        return [self.load(key) for key in keys]
+
+    def dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        if not keys:
+            return
+        values = self.batch_load_fn(keys)
+        for key, value in zip(keys, values):
+            self._cache[key] = value
+
+
+class Loaders:
+    """Registry holding one DataLoader per relation for a single request"""
+
+    def __init__(self):
+        self.customer = DataLoader(self._load_customers)
+        self.product = DataLoader(self._load_products)
+        self.order = DataLoader(self._load_orders)
+        self.customer_orders = DataLoader(self._load_customer_orders)
+        self.order_products = DataLoader(self._load_order_products)
+        self.order_items = DataLoader(self._load_order_items)
+        self.product_orders = DataLoader(self._load_product_orders)
+        self.product_items = DataLoader(self._load_product_items)
+
+        self._by_model = {
+            Customer: self.customer,
+            Product: self.product,
+            Order: self.order,
+        }
+
+        # (loader, attribute holding its key) for every relation a parent
+        # model can request
+        self._relations = {
+            Customer: [(self.customer_orders, 'pk')],
+            Product: [(self.product_orders, 'pk'), (self.product_items, 'pk')],
+            Order: [
+                (self.customer, 'customer_id'),
+                (self.order_products, 'pk'),
+                (self.order_items, 'pk'),
+            ],
+            OrderItem: [(self.order, 'order_id'), (self.product, 'product_id')],
+        }
+
+    def enqueue(self, instances):
+        """Queue the relation keys of a batch of sibling objects"""
+        by_model = defaultdict(list)
+        for instance in instances:
+            by_model[type(instance)].append(instance)
+
+        for model, objects in by_model.items():
+            loader = self._by_model.get(model)
+            if loader is not None:
+                for obj in objects:
+                    loader.prime(obj.pk, obj)
+            for loader, attname in self._relations.get(model, ()):
+                loader.enqueue(_key(obj, attname) for obj in objects)
+
+    # Batch functions
+
+    def _by_id(self, model, keys):
+        objects = model.objects.in_bulk(keys)
+        self.enqueue(objects.values())
+        return [objects.get(key) for key in keys]
+
+    def _grouped(self, queryset, key_field, keys):
+        groups = defaultdict(list)
+        for obj in queryset:
+            groups[getattr(obj, key_field)].append(obj)
+        self.enqueue(obj for group in groups.values() for obj in group)
+        return [groups.get(key, []) for key in keys]
+
+    def _load_customers(self, keys):
+        return self._by_id(Customer, keys)
+
+    def _load_products(self, keys):
+        return self._by_id(Product, keys)
+
+    def _load_orders(self, keys):
+        return self._by_id(Order, keys)
+
+    def _load_customer_orders(self, keys):
+        queryset = Order.objects.filter(customer_id__in=keys)
+        return self._grouped(queryset, 'customer_id', keys)
+
+    def _load_order_products(self, keys):
+        queryset = Product.objects.filter(
+            orderitem__order_id__in=keys
+        ).annotate(loader_key=F('orderitem__order_id'))
+        return self._grouped(queryset, 'loader_key', keys)
+
+    def _load_order_items(self, keys):
+        queryset = OrderItem.objects.filter(order_id__in=keys).order_by('pk')
+        return self._grouped(queryset, 'order_id', keys)
+
+    def _load_product_orders(self, keys):
+        queryset = Order.objects.filter(
+            orderitem__product_id__in=keys
+        ).annotate(loader_key=F('orderitem__product_id'))
+        return self._grouped(queryset, 'loader_key', keys)
+
+    def _load_product_items(self, keys):
+        queryset = OrderItem.objects.filter(product_id__in=keys).order_by('pk')
+        return self._grouped(queryset, 'product_id', keys)
+
+
+def _key(instance, attname):
+    # Read straight from __dict__ so columns deferred by only() are skipped
+    # instead of being fetched one row at a time
+    if attname == 'pk':
+        return instance.pk
+    return instance.__dict__.get(attname)
+
+
+def get_loaders(info):
+    """Return the Loaders registry for the request being executed"""
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        if context is not None:
+            context.loaders = loaders
+    return loaders
+
+
+class LoaderMiddleware:
+    """
+    Graphene middleware that queues relation keys for every list of model
+    instances a field resolves to, so the loaders see all siblings at once.
+    """
+
+    def resolve(self, next, root, info, **args):
+        result = next(root, info, **args)
+        if isawaitable(result):
+            # Async resolvers return already-evaluated lists
+            return self._resolve_async(result, info)
+        return self._enqueue(result, info)
+
+    async def _resolve_async(self, result, info):
+        return self._enqueue(await result, info)
+
+    def _enqueue(self, result, info):
+        if isinstance(result, QuerySet):
+            result = list(result)
+
+        if isinstance(result, list):
+            instances = result
+        elif hasattr(result, 'edges') and isinstance(result.edges, list):
+            instances = [edge.node for edge in result.edges]
+        else:
+            return result
+
+        if instances and isinstance(instances[0], Model):
+            get_loaders(info).enqueue(instances)
+        return result
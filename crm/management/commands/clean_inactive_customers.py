@@ -0,0 +1,76 @@
+"""
+Delete customers with no orders in the last year
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from crm import rollups
+from crm.cache import invalidate_models
+from crm.models import Customer, Order
+
+
+LOG_FILE = '/tmp/customer_cleanup_log.txt'
+
+
+def inactive_customers(cutoff):
+    """
+    Customers without an order on or after ``cutoff``, read from the
+    maintained last_order_date column as one indexed range scan
+    """
+    return Customer.objects.filter(Q(last_order_date__lt=cutoff) | Q(last_order_date__isnull=True))
+
+
+class Command(BaseCommand):
+    help = "Delete customers with no orders since a cutoff, in bounded batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help="Customers with no orders in this many days are inactive (default: 365)",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Customers deleted per transaction (default: 1000)",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only count the inactive customers",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        queryset = inactive_customers(cutoff)
+
+        if options['dry_run']:
+            count = queryset.count()
+            self.stdout.write(f"{count} inactive customers would be deleted")
+            return
+
+        deleted_count = 0
+        while True:
+            # Each batch is its own short transaction so writers are never
+            # blocked for the length of the whole run. Order signals are
+            # suspended so the rollups get one aggregated update per batch
+            # rather than one per deleted order
+            with transaction.atomic(), rollups.suspended():
+                batch = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not batch:
+                    break
+                rollups.subtract_orders(Order.objects.filter(customer_id__in=batch))
+                Customer.objects.filter(pk__in=batch).delete()
+            deleted_count += len(batch)
+            self.stdout.write(f"Deleted {deleted_count} inactive customers so far")
+
+        invalidate_models(Customer, Order)
+
+        timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(LOG_FILE, 'a') as f:
+            f.write(f"{timestamp} - Deleted {deleted_count} inactive customers\n")
+
+        self.stdout.write(f"Deleted {deleted_count} inactive customers")
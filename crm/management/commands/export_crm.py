@@ -0,0 +1,74 @@
+"""
+Export a CRM table as CSV or NDJSON
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.exports import EXPORTS, FORMATS, ExportError, Exporter, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream customers, products, orders or order_items to a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument(
+            '--output', '-o',
+            help="File to write (default: stdout)",
+        )
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip")
+        parser.add_argument(
+            '--after', type=int,
+            help="Resume after this primary key (the cursor reported by a previous run)",
+        )
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help="FilterSet filter from crm/filters.py, e.g. order_date__gte=2025-01-01 (repeatable)",
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help="Rows read per query (default: CRM_EXPORT_BATCH_SIZE)",
+        )
+        parser.add_argument('--no-header', action='store_true', help="Omit the CSV header row")
+
+    def handle(self, *args, **options):
+        filters = {}
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Filters must look like NAME=VALUE, got '{item}'")
+            filters[name] = value
+
+        try:
+            exporter = Exporter(
+                options['table'],
+                format=options['format'],
+                filters=filters,
+                after=options['after'],
+                batch_size=options['batch_size'],
+                header=not options['no_header'],
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        chunks = iter(exporter)
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+            # Written to stderr so it never ends up in the exported data
+            message = f"Exported {exporter.rows} rows"
+            if exporter.cursor is not None:
+                message += f"; resume with --after {exporter.cursor}"
+            self.stderr.write(message)
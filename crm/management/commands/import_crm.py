@@ -0,0 +1,109 @@
+"""
+Import customers, products or orders from a CSV or NDJSON file
+"""
+
+import csv
+import gzip
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.cache import invalidate_models
+from crm.imports import CONFLICT_MODES, FORMATS, ImportFailed, Importer, read_rows
+from crm.models import Customer, Order, OrderItem, Product
+
+
+INVALIDATES = {
+    'customers': (Customer,),
+    'products': (Product,),
+    'orders': (Order, OrderItem, Customer),
+}
+
+
+class Command(BaseCommand):
+    help = "Bulk load customers, products or orders from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(INVALIDATES))
+        parser.add_argument('path', help="File to import, '-' for stdin; .gz files are decompressed")
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help="File format (default: from the file extension, else csv)",
+        )
+        parser.add_argument(
+            '--on-conflict', choices=CONFLICT_MODES, default='error',
+            help="Existing customer emails / product ids: reject (default), skip or update them",
+        )
+        parser.add_argument(
+            '--rejects',
+            help="Write rejected rows, with their line number and error, to this file",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help="Rows per chunk (default: CRM_BULK_CHUNK_SIZE)",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('ndjson' if '.ndjson' in path or '.jsonl' in path else 'csv')
+
+        try:
+            importer = Importer(
+                options['table'],
+                on_conflict=options['on_conflict'],
+                chunk_size=options['chunk_size'],
+            )
+        except ImportFailed as e:
+            raise CommandError(str(e))
+
+        if path == '-':
+            stream = sys.stdin
+        elif path.endswith('.gz'):
+            stream = gzip.open(path, 'rt', newline='', encoding='utf-8')
+        else:
+            stream = open(path, newline='', encoding='utf-8')
+
+        rejects = RejectWriter(options['rejects'], format) if options['rejects'] else None
+        started = time.monotonic()
+        try:
+            importer.run(read_rows(stream, format), on_reject=rejects)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects is not None:
+                rejects.close()
+        elapsed = time.monotonic() - started
+
+        if importer.written:
+            invalidate_models(*INVALIDATES[options['table']])
+
+        rate = importer.read / elapsed if elapsed else importer.read
+        self.stdout.write(
+            f"Read {importer.read} rows: {importer.written} written, {importer.skipped} skipped, "
+            f"{importer.rejected} rejected in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+        )
+
+
+class RejectWriter:
+    """Writes rejected rows in the input format plus ``line`` and ``error``"""
+
+    def __init__(self, path, format):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.format = format
+        self.writer = None
+
+    def __call__(self, reject):
+        row = dict(reject.row or {})
+        row.update(line=reject.line, error=reject.reason)
+        if self.format == 'ndjson':
+            self.file.write(json.dumps(row, default=str) + '\n')
+            return
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(row), extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,22 @@
+"""
+Recompute the order rollup tables from the Order table
+"""
+
+from django.core.management.base import BaseCommand
+
+from crm.cache import invalidate_models
+from crm.models import CustomerDailyRollup, HourlyOrderRollup, Order
+from crm.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly and per-customer daily order rollups"
+
+    def handle(self, *args, **options):
+        rebuild()
+        # crmStats responses are cached against Order
+        invalidate_models(Order)
+        self.stdout.write(
+            f"Rebuilt {HourlyOrderRollup.objects.count()} hourly and "
+            f"{CustomerDailyRollup.objects.count()} customer daily rollups"
+        )
@@ -0,0 +1,55 @@
+"""
+Detect and repair drift in the denormalized customer order summaries
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.cache import invalidate_models
+from crm.models import Customer
+from crm.summaries import drifted_customers, refresh_customers
+
+
+class Command(BaseCommand):
+    help = "Recompute last_order_date, order_count and lifetime_value where they drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Customers repaired per transaction (default: 1000)",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the customers that drifted",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        drifted = drifted_customers().order_by('pk')
+
+        if options['dry_run']:
+            for customer in drifted.iterator():
+                self.stdout.write(
+                    f"Customer {customer.pk}: stored "
+                    f"({customer.order_count}, {customer.lifetime_value}, {customer.last_order_date}), "
+                    f"actual ({customer.actual_order_count}, {customer.actual_lifetime_value}, "
+                    f"{customer.actual_last_order_date})"
+                )
+            return
+
+        repaired = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    drifted.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size]
+                )
+                if not batch:
+                    break
+                refresh_customers(batch)
+            repaired += len(batch)
+            last_pk = batch[-1]
+
+        if repaired:
+            invalidate_models(Customer)
+        self.stdout.write(f"Repaired {repaired} customer summaries")
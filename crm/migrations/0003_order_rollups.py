@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour
+
+
+def backfill_rollups(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    HourlyOrderRollup = apps.get_model('crm', 'HourlyOrderRollup')
+    CustomerDailyRollup = apps.get_model('crm', 'CustomerDailyRollup')
+
+    orders = Order.objects.order_by()
+    HourlyOrderRollup.objects.bulk_create(
+        (
+            HourlyOrderRollup(hour=row['hour'], order_count=row['count'], revenue=row['revenue'] or 0)
+            for row in orders.annotate(hour=TruncHour('order_date'))
+            .values('hour')
+            .annotate(count=Count('id'), revenue=Sum('total_amount'))
+            .iterator()
+        ),
+        batch_size=1000,
+    )
+    CustomerDailyRollup.objects.bulk_create(
+        (
+            CustomerDailyRollup(
+                customer_id=row['customer_id'],
+                day=row['day'],
+                order_count=row['count'],
+                revenue=row['revenue'] or 0,
+            )
+            for row in orders.annotate(day=TruncDate('order_date'))
+            .values('customer_id', 'day')
+            .annotate(count=Count('id'), revenue=Sum('total_amount'))
+            .iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_filter_and_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['hour'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='crm.customer')),
+            ],
+            options={
+                'ordering': ['day'],
+                'constraints': [models.UniqueConstraint(fields=('customer', 'day'), name='crm_customer_day_rollup_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
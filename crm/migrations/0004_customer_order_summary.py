@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:09
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_summaries(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    Customer.objects.update(
+        last_order_date=Subquery(orders.annotate(value=Max('order_date')).values('value')[:1]),
+        order_count=Coalesce(Subquery(orders.annotate(value=Count('id')).values('value')[:1]), 0),
+        lifetime_value=Coalesce(
+            Subquery(orders.annotate(value=Sum('total_amount')).values('value')[:1]),
+            Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_order_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_value',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_order_date'], name='crm_customer_last_order_idx'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
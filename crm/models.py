@@ -7,6 +7,10 @@ class Customer(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # Order summary, maintained from order writes (see crm/summaries.py)
+    last_order_date = models.DateTimeField(blank=True, null=True)
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -15,6 +19,12 @@ class Customer(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Default ordering and keyset pagination on (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='crm_customer_created_id_idx'),
+            # Inactive-customer scans (last_order_date < cutoff)
+            models.Index(fields=['last_order_date'], name='crm_customer_last_order_idx'),
+        ]
 
 
 class Product(models.Model):
@@ -29,6 +39,12 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Low-stock scans (stock < 10)
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['created_at', 'id'], name='crm_product_created_id_idx'),
+        ]
 
 
 class Order(models.Model):
@@ -50,6 +66,13 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            # Per-customer activity, e.g. the inactive-customer cleanup
+            models.Index(fields=['customer', 'order_date'], name='crm_order_customer_date_idx'),
+            # Default ordering, date-range filters and keyset pagination
+            models.Index(fields=['order_date', 'id'], name='crm_order_date_id_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -64,3 +87,33 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity}x {self.product.name} in Order {self.order.id}"
+
+
+class HourlyOrderRollup(models.Model):
+    """Order count and revenue per hour, maintained by crm.rollups"""
+    hour = models.DateTimeField(unique=True)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} - {self.order_count} orders"
+
+    class Meta:
+        ordering = ['hour']
+
+
+class CustomerDailyRollup(models.Model):
+    """Order count and revenue per customer per day, maintained by crm.rollups"""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.customer_id} {self.day} - {self.order_count} orders"
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'day'], name='crm_customer_day_rollup_uniq'),
+        ]
@@ -0,0 +1,186 @@
+"""
+Query-shape-aware queryset optimizer for the CRM GraphQL schema
+
+Root resolvers pass their queryset through ``optimize_queryset`` which
+walks the selection set of the current field and applies
+``select_related`` for forward foreign keys, ``prefetch_related`` for
+reverse foreign keys and many-to-many relations, and ``only()`` so the
+SELECT list matches the requested columns.
+"""
+
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+PAGINATION_ARGS = {'first', 'last', 'before', 'after', 'offset'}
+
+
+class _Plan:
+    """Accumulates the optimizations for one root queryset"""
+
+    def __init__(self):
+        self.only = set()
+        self.select_related = []
+        self.prefetch_related = []
+        # Set to False when a selected field does not map onto a model
+        # column, in which case only() would trigger per-row deferred loads
+        self.exact = True
+
+
+def optimize_queryset(queryset, info, extra_fields=()):
+    """
+    Return ``queryset`` optimized for the selection of the current field.
+    ``extra_fields`` are always loaded, e.g. columns used to build cursors.
+    """
+    selections = []
+    for field_node in info.field_nodes:
+        if field_node.selection_set:
+            selections.extend(field_node.selection_set.selections)
+
+    plan = _Plan()
+    plan.only.update(extra_fields)
+    _plan_model(plan, queryset.model, _unwrap_connection(selections, info), info, prefix='')
+    return _apply(queryset, plan)
+
+
+def get_prefetched(instance, accessor):
+    """Return the prefetched objects of a to-many relation, or None"""
+    queryset = getattr(instance, accessor).all()
+    if queryset._result_cache is None:
+        return None
+    return list(queryset)
+
+
+def selected_fields(info):
+    """Snake-case names of the fields selected on the current field"""
+    return {
+        to_snake_case(name)
+        for name in _collect_fields(_sub_selections(info.field_nodes), info)
+    }
+
+
+def is_loaded(instance, name, filtered=False):
+    """
+    Return False when resolving attribute ``name`` of a model instance will
+    query the database: a deferred column, a foreign key that was not
+    select_related, or a to-many relation that was not prefetched (or is
+    ``filtered`` by field arguments).
+    """
+    field = _model_fields(type(instance)).get(name)
+    if field is None:
+        return True
+    if not field.is_relation:
+        return name not in instance.get_deferred_fields()
+    if field.many_to_one or field.one_to_one:
+        return field.is_cached(instance)
+    return not filtered and get_prefetched(instance, name) is not None
+
+
+def _apply(queryset, plan):
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    if plan.prefetch_related:
+        queryset = queryset.prefetch_related(*plan.prefetch_related)
+    if plan.exact:
+        queryset = queryset.only(*plan.only)
+    return queryset
+
+
+def _plan_model(plan, model, selections, info, prefix):
+    fields = _model_fields(model)
+    plan.only.add(prefix + model._meta.pk.name)
+
+    for name, nodes in _collect_fields(selections, info).items():
+        if name == '__typename':
+            continue
+
+        name = to_snake_case(name)
+        if name == 'id':
+            continue
+
+        field = fields.get(name)
+        if field is None:
+            plan.exact = False
+            continue
+
+        if not field.is_relation:
+            plan.only.add(prefix + field.name)
+        elif field.concrete and (field.many_to_one or field.one_to_one):
+            path = prefix + field.name
+            plan.only.add(path)
+            plan.select_related.append(path)
+            _plan_model(plan, field.related_model, _sub_selections(nodes), info, path + '__')
+        elif not _has_filter_args(nodes):
+            plan.prefetch_related.append(
+                _prefetch(field, prefix + name, _sub_selections(nodes), info)
+            )
+
+
+def _prefetch(field, lookup, selections, info):
+    related_model = field.related_model
+    nested = _Plan()
+    _plan_model(nested, related_model, _unwrap_connection(selections, info), info, prefix='')
+
+    if field.one_to_many:
+        # Django needs the foreign key back to the parent to attach the rows
+        nested.only.add(field.field.name)
+
+    queryset = _apply(related_model._default_manager.all(), nested)
+    return Prefetch(lookup, queryset=queryset)
+
+
+def _model_fields(model):
+    """Map attribute names, including reverse accessors, to model fields"""
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def _collect_fields(selections, info):
+    """Group the FieldNodes of a selection set by name, expanding fragments"""
+    fields = {}
+    for selection in selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            for name, nodes in _collect_fields(fragment.selection_set.selections, info).items():
+                fields.setdefault(name, []).extend(nodes)
+        elif isinstance(selection, InlineFragmentNode):
+            for name, nodes in _collect_fields(selection.selection_set.selections, info).items():
+                fields.setdefault(name, []).extend(nodes)
+    return fields
+
+
+def _sub_selections(nodes):
+    selections = []
+    for node in nodes:
+        if node.selection_set:
+            selections.extend(node.selection_set.selections)
+    return selections
+
+
+def _unwrap_connection(selections, info):
+    """Return the ``edges { node { ... } }`` selections of a Relay connection"""
+    fields = _collect_fields(selections, info)
+    if 'edges' not in fields:
+        return selections
+
+    node_selections = []
+    for name, nodes in _collect_fields(_sub_selections(fields['edges']), info).items():
+        if name == 'node':
+            node_selections.extend(_sub_selections(nodes))
+    return node_selections
+
+
+def _has_filter_args(nodes):
+    return any(
+        argument.name.value not in PAGINATION_ARGS
+        for node in nodes
+        for argument in node.arguments
+    )
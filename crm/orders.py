@@ -0,0 +1,83 @@
+"""
+Order creation shared by the order mutations
+
+An order is written with a fixed number of queries however many lines it
+has: products are fetched with one ``in_bulk``, the order row is inserted
+with its final total and the lines go in through one ``bulk_create``.
+"""
+
+from django.db import transaction
+
+from .models import Order, OrderItem, Product
+from .stock import InsufficientStock, reserve_stock
+
+
+class OrderError(Exception):
+    """Raised when an order request cannot be fulfilled"""
+
+
+def merge_lines(product_ids, quantities=None):
+    """
+    Return ``{product_id: quantity}`` for an order request.
+
+    ``quantities`` is optional and aligned with ``product_ids``; a missing
+    list means one of each. Repeated product ids are merged into a single
+    line.
+    """
+    if not product_ids:
+        raise OrderError("At least one product must be selected")
+
+    if quantities is None:
+        quantities = [1] * len(product_ids)
+    elif len(quantities) != len(product_ids):
+        raise OrderError("Quantities must match product IDs")
+
+    lines = {}
+    for product_id, quantity in zip(product_ids, quantities):
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise OrderError(f"Invalid product ID: {product_id}")
+        if quantity is None or quantity < 1:
+            raise OrderError(f"Invalid quantity for product ID: {product_id}")
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines
+
+
+def fetch_products(lines):
+    """Load every product referenced by ``lines`` with a single query"""
+    products = Product.objects.in_bulk(list(lines))
+    for product_id in lines:
+        if product_id not in products:
+            raise OrderError(f"Invalid product ID: {product_id}")
+    return products
+
+
+def build_order(customer, lines, products):
+    """Return an unsaved order and its unsaved items, total included"""
+    items = [
+        OrderItem(product=products[product_id], quantity=quantity, price=products[product_id].price)
+        for product_id, quantity in lines.items()
+    ]
+    total_amount = sum(item.subtotal for item in items)
+    return Order(customer=customer, total_amount=total_amount), items
+
+
+def create_order(customer, lines, products):
+    """
+    Reserve stock, then insert an order and its items; returns the saved
+    order. Raises OrderError without writing anything when stock is short.
+    """
+    order, items = build_order(customer, lines, products)
+    try:
+        with transaction.atomic():
+            reserve_stock(lines)
+            order.save()
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+    except InsufficientStock as e:
+        raise OrderError(str(e))
+    # The order summary columns were updated in SQL by the post_save handler
+    customer.refresh_from_db(fields=['last_order_date', 'order_count', 'lifetime_value'])
+    return order
@@ -0,0 +1,83 @@
+"""
+GraphQL operations sent by the CRM cron jobs and Celery tasks
+
+These are registered with the endpoint ahead of time as persisted queries
+(see crm/documents.py), so the clients send only their hash.
+"""
+
+from .documents import query_hash
+
+
+HEARTBEAT_QUERY = """
+query Heartbeat {
+    hello
+}
+"""
+
+UPDATE_LOW_STOCK_MUTATION = """
+mutation UpdateLowStockProducts {
+    updateLowStockProducts {
+        updatedProducts {
+            id
+            name
+            stock
+            price
+        }
+        successMessage
+        errors
+    }
+}
+"""
+
+CRM_STATS_QUERY = """
+query GetCRMStats {
+    crmStats {
+        customerCount
+        orderCount
+        revenue
+    }
+}
+"""
+
+# The date window is applied in SQL; results arrive one page at a time
+RECENT_ORDERS_QUERY = """
+query GetRecentOrders($since: DateTime!, $first: Int!, $after: String) {
+    ordersSince(since: $since, first: $first, after: $after) {
+        pageInfo {
+            hasNextPage
+            endCursor
+        }
+        edges {
+            node {
+                id
+                orderDate
+                totalAmount
+                customer {
+                    id
+                    name
+                    email
+                }
+            }
+        }
+    }
+}
+"""
+
+PERSISTED_QUERIES = (
+    HEARTBEAT_QUERY,
+    UPDATE_LOW_STOCK_MUTATION,
+    CRM_STATS_QUERY,
+    RECENT_ORDERS_QUERY,
+)
+
+
+def persisted_payload(query, variables=None):
+    """Request body that refers to a registered query by its hash"""
+    payload = {
+        'extensions': {
+            'persistedQuery': {'version': 1, 'sha256Hash': query_hash(query)},
+        },
+    }
+    if variables is not None:
+        payload['variables'] = variables
+    return payload
@@ -0,0 +1,251 @@
+"""
+Incrementally maintained order rollups
+
+HourlyOrderRollup and CustomerDailyRollup hold order counts and revenue
+per hour and per customer per day. They are kept up to date as orders
+are created, updated and deleted, so reports read a number of rows that
+depends on the time window instead of on the size of the Order table.
+The same deltas also maintain the per-customer summary columns (see
+crm/summaries.py).
+
+Single-object saves and deletes are tracked through model signals. Bulk
+paths that bypass signals (bulk_create, batched deletes) call
+``record_orders`` / ``subtract_orders`` themselves. ``rebuild`` recomputes
+everything from scratch and is exposed as the ``rebuild_rollups``
+management command.
+"""
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CustomerDailyRollup, HourlyOrderRollup, Order
+from .summaries import apply_customer_deltas
+
+
+_state = threading.local()
+
+UPSERT_BATCH_SIZE = 250
+
+
+@contextmanager
+def suspended():
+    """Ignore order signals, for callers that apply the deltas themselves"""
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+def hour_bucket(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(value):
+    return timezone.localdate(value)
+
+
+def apply_deltas(deltas):
+    """
+    Apply ``(order_date, customer_id, count, revenue)`` deltas.
+
+    Deltas are summed per bucket first so each rollup row is written at
+    most once.
+    """
+    hourly = defaultdict(lambda: [0, Decimal('0')])
+    daily = defaultdict(lambda: [0, Decimal('0')])
+    # customer_id -> [count, revenue, latest added order_date, removed]
+    customers = defaultdict(lambda: [0, Decimal('0'), None, False])
+    for order_date, customer_id, count, revenue in deltas:
+        bucket = hourly[hour_bucket(order_date)]
+        bucket[0] += count
+        bucket[1] += revenue
+        bucket = daily[(customer_id, day_bucket(order_date))]
+        bucket[0] += count
+        bucket[1] += revenue
+        summary = customers[customer_id]
+        summary[0] += count
+        summary[1] += revenue
+        if count > 0 and (summary[2] is None or order_date > summary[2]):
+            summary[2] = order_date
+        elif count < 0:
+            summary[3] = True
+
+    with transaction.atomic():
+        _apply(HourlyOrderRollup, ('hour',), [((hour,), c, r) for hour, (c, r) in hourly.items()])
+        _apply(
+            CustomerDailyRollup,
+            ('customer_id', 'day'),
+            [(key, c, r) for key, (c, r) in daily.items()],
+        )
+        apply_customer_deltas({pk: tuple(summary) for pk, summary in customers.items()})
+
+
+def record_orders(orders):
+    """Add newly inserted orders to the rollups"""
+    apply_deltas(
+        (order.order_date, order.customer_id, 1, order.total_amount)
+        for order in orders
+    )
+
+
+def subtract_orders(queryset):
+    """Remove the orders in ``queryset`` from the rollups before deleting them"""
+    rows = (
+        queryset.order_by()
+        .annotate(hour=TruncHour('order_date'))
+        .values('hour', 'customer_id')
+        .annotate(count=Count('id'), revenue=Sum('total_amount'))
+    )
+    apply_deltas(
+        (row['hour'], row['customer_id'], -row['count'], -(row['revenue'] or Decimal('0')))
+        for row in rows
+    )
+
+
+def rebuild():
+    """Recompute both rollup tables from the Order table"""
+    orders = Order.objects.order_by()
+    with transaction.atomic():
+        HourlyOrderRollup.objects.all().delete()
+        CustomerDailyRollup.objects.all().delete()
+
+        HourlyOrderRollup.objects.bulk_create(
+            (
+                HourlyOrderRollup(hour=row['hour'], order_count=row['count'], revenue=row['revenue'] or 0)
+                for row in orders.annotate(hour=TruncHour('order_date'))
+                .values('hour')
+                .annotate(count=Count('id'), revenue=Sum('total_amount'))
+                .iterator()
+            ),
+            batch_size=1000,
+        )
+        CustomerDailyRollup.objects.bulk_create(
+            (
+                CustomerDailyRollup(
+                    customer_id=row['customer_id'],
+                    day=row['day'],
+                    order_count=row['count'],
+                    revenue=row['revenue'] or 0,
+                )
+                for row in orders.annotate(day=TruncDate('order_date'))
+                .values('customer_id', 'day')
+                .annotate(count=Count('id'), revenue=Sum('total_amount'))
+                .iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+def _apply(model, key_fields, rows):
+    rows = [row for row in rows if row[1] or row[2]]
+    # Only additions may create rows. Subtractions are update-only so that a
+    # customer deleted in the same transaction never gets a rollup recreated.
+    additions = [row for row in rows if row[1] > 0]
+    updates = [row for row in rows if row[1] <= 0]
+
+    if additions and connection.vendor in ('postgresql', 'sqlite'):
+        for start in range(0, len(additions), UPSERT_BATCH_SIZE):
+            _upsert(model, key_fields, additions[start:start + UPSERT_BATCH_SIZE])
+    else:
+        updates = rows
+
+    for key, count, revenue in updates:
+        lookup = dict(zip(key_fields, key))
+        updated = model.objects.filter(**lookup).update(
+            order_count=F('order_count') + count,
+            revenue=F('revenue') + revenue,
+        )
+        if count < 0:
+            # Drop buckets that no longer hold any order
+            model.objects.filter(order_count__lte=0, **lookup).delete()
+        if updated or count <= 0:
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(order_count=count, revenue=revenue, **lookup)
+        except IntegrityError:
+            # Another writer created the row first
+            model.objects.filter(**lookup).update(
+                order_count=F('order_count') + count,
+                revenue=F('revenue') + revenue,
+            )
+
+
+def _upsert(model, key_fields, rows):
+    """INSERT ... ON CONFLICT DO UPDATE that adds to the existing counters"""
+    qn = connection.ops.quote_name
+    opts = model._meta
+    fields = [opts.get_field(name) for name in key_fields] + [
+        opts.get_field('order_count'),
+        opts.get_field('revenue'),
+    ]
+    table = qn(opts.db_table)
+    columns = ', '.join(qn(field.column) for field in fields)
+    conflict = ', '.join(qn(field.column) for field in fields[:len(key_fields)])
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(rows))
+
+    params = []
+    for key, count, revenue in rows:
+        for field, value in zip(fields, (*key, count, revenue)):
+            params.append(field.get_db_prep_save(value, connection))
+
+    order_count = qn(opts.get_field('order_count').column)
+    revenue = qn(opts.get_field('revenue').column)
+    sql = (
+        f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+        f"ON CONFLICT ({conflict}) DO UPDATE SET "
+        f"{order_count} = {table}.{order_count} + EXCLUDED.{order_count}, "
+        f"{revenue} = {table}.{revenue} + EXCLUDED.{revenue}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+# Signal handlers for single-object saves and deletes
+
+@receiver(pre_save, sender=Order)
+def _remember_previous_values(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if instance._state.adding or instance.pk is None or is_suspended():
+        return
+    instance._rollup_previous = (
+        Order.objects.filter(pk=instance.pk)
+        .values_list('order_date', 'customer_id', 'total_amount')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Order)
+def _order_saved(sender, instance, created, **kwargs):
+    if is_suspended():
+        return
+    deltas = [(instance.order_date, instance.customer_id, 1, instance.total_amount)]
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        order_date, customer_id, total_amount = previous
+        deltas.append((order_date, customer_id, -1, -total_amount))
+    elif not created:
+        return
+    apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Order)
+def _order_deleted(sender, instance, **kwargs):
+    if is_suspended():
+        return
+    apply_deltas([(instance.order_date, instance.customer_id, -1, -instance.total_amount)])
@@ -1,15 +1,44 @@
 import graphene
-from graphene_django import DjangoObjectType
+from asgiref.sync import sync_to_async
+from graphene_django import DjangoObjectType, DjangoConnectionField
 from graphene_django.filter import DjangoFilterConnectionField
-from django.db import transaction
 from django.core.exceptions import ValidationError
-import re
 from .models import Customer, Product, Order, OrderItem
+from .aio import aget_or_none, alist, run_sync, running_async, threaded
+from .bulk import bulk_create_customers, bulk_create_orders, bulk_create_products, get_chunk_size
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .fields import BatchedFilterConnectionField, KeysetConnectionField
+from .loaders import get_loaders
+from .orders import OrderError, create_order, fetch_products, merge_lines
+from .optimizer import PAGINATION_ARGS, get_prefetched, optimize_queryset, selected_fields
+from .stats import DEFAULT_PERCENTILES, CRMStats
+from .stock import restock_low_stock
+from .streaming import get_stream
+from .validators import is_valid_phone
+
+
+def _has_filter_args(kwargs):
+    """Return True when a connection resolver received filtering arguments"""
+    return any(
+        value is not None
+        for key, value in kwargs.items()
+        if key not in PAGINATION_ARGS
+    )
+
+
+def _flatten_errors(results):
+    """Turn per-item bulk results into the flat errors list of a response"""
+    return [
+        f"Item {result['index']}: {error}"
+        for result in results
+        for error in result['errors']
+    ]
 
 
 # Type Definitions
 class CustomerType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Customer
         interfaces = (graphene.relay.Node,)
@@ -20,8 +49,20 @@ class CustomerType(DjangoObjectType):
             'created_at': ['exact', 'gte', 'lte'],
         }
 
+    def resolve_orders(self, info, **kwargs):
+        if _has_filter_args(kwargs):
+            # Filtered connections are not batched: one query per customer
+            return self.orders.all()
+        prefetched = get_prefetched(self, 'orders')
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).customer_orders.load(self.pk)
+
 
 class ProductType(DjangoObjectType):
+    order_set = BatchedFilterConnectionField(lambda: OrderType, required=True)
+    orderitem_set = DjangoConnectionField(lambda: OrderItemType, required=True)
+
     class Meta:
         model = Product
         interfaces = (graphene.relay.Node,)
@@ -31,14 +72,42 @@ class ProductType(DjangoObjectType):
             'stock': ['exact', 'gte', 'lte'],
         }
 
+    def resolve_order_set(self, info, **kwargs):
+        if _has_filter_args(kwargs):
+            # Filtered connections are not batched: one query per product
+            return self.order_set.all()
+        prefetched = get_prefetched(self, 'order_set')
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).product_orders.load(self.pk)
+
+    def resolve_orderitem_set(self, info, **kwargs):
+        prefetched = get_prefetched(self, 'orderitem_set')
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).product_items.load(self.pk)
+
 
 class OrderItemType(DjangoObjectType):
     class Meta:
         model = OrderItem
         interfaces = (graphene.relay.Node,)
 
+    def resolve_order(self, info):
+        if OrderItem.order.is_cached(self):
+            return self.order
+        return get_loaders(info).order.load(self.order_id)
+
+    def resolve_product(self, info):
+        if OrderItem.product.is_cached(self):
+            return self.product
+        return get_loaders(info).product.load(self.product_id)
+
 
 class OrderType(DjangoObjectType):
+    products = BatchedFilterConnectionField(ProductType, required=True)
+    orderitem_set = DjangoConnectionField(OrderItemType, required=True)
+
     class Meta:
         model = Order
         interfaces = (graphene.relay.Node,)
@@ -47,6 +116,55 @@ class OrderType(DjangoObjectType):
             'order_date': ['exact', 'gte', 'lte'],
         }
 
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        if _has_filter_args(kwargs):
+            return self.products.all()
+        prefetched = get_prefetched(self, 'products')
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).order_products.load(self.pk)
+
+    def resolve_orderitem_set(self, info, **kwargs):
+        prefetched = get_prefetched(self, 'orderitem_set')
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).order_items.load(self.pk)
+
+
+# Statistics Types
+class StatsPeriod(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+
+class PercentileType(graphene.ObjectType):
+    percentile = graphene.Float()
+    value = graphene.Decimal()
+
+
+class StatsPeriodType(graphene.ObjectType):
+    period_start = graphene.DateTime()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class CRMStatsType(graphene.ObjectType):
+    customer_count = graphene.Int(description="Customers created in the date range")
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+    average_order_value = graphene.Decimal()
+    percentiles = graphene.List(PercentileType, description="Nearest-rank percentiles of order totals")
+    periods = graphene.List(StatsPeriodType)
+
+    # Models the response cache treats this type as reading
+    cache_models = (Customer, Order)
+
 
 # Input Types
 class CustomerInput(graphene.InputObjectType):
@@ -64,6 +182,7 @@ class ProductInput(graphene.InputObjectType):
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
     product_ids = graphene.List(graphene.ID, required=True)
+    quantities = graphene.List(graphene.Int)
     order_date = graphene.DateTime()
 
 
@@ -89,6 +208,30 @@ class CreateOrderResponse(graphene.ObjectType):
     errors = graphene.List(graphene.String)
 
 
+class BulkProductResult(graphene.ObjectType):
+    index = graphene.Int()
+    product = graphene.Field(ProductType)
+    errors = graphene.List(graphene.String)
+
+
+class BulkCreateProductsResponse(graphene.ObjectType):
+    products = graphene.List(ProductType)
+    results = graphene.List(BulkProductResult)
+    errors = graphene.List(graphene.String)
+
+
+class BulkOrderResult(graphene.ObjectType):
+    index = graphene.Int()
+    order = graphene.Field(OrderType)
+    errors = graphene.List(graphene.String)
+
+
+class BulkCreateOrdersResponse(graphene.ObjectType):
+    orders = graphene.List(OrderType)
+    results = graphene.List(BulkOrderResult)
+    errors = graphene.List(graphene.String)
+
+
 class UpdateLowStockProductsResponse(graphene.ObjectType):
     updated_products = graphene.List(ProductType)
     success_message = graphene.String()
@@ -103,6 +246,9 @@ class CreateCustomer(graphene.Mutation):
     Output = CreateCustomerResponse
 
     def mutate(self, info, input):
+        if running_async():
+            return CreateCustomer.mutate_async(input)
+
         errors = []
         
         # Validate email uniqueness
@@ -112,8 +258,7 @@ class CreateCustomer(graphene.Mutation):
         
         # Validate phone format if provided
         if input.phone:
-            phone_pattern = r'^(\+\d{1,3}[- ]?)?\(?\d{3}\)?[- ]?\d{3}[- ]?\d{4}$'
-            if not re.match(phone_pattern, input.phone):
+            if not is_valid_phone(input.phone):
                 errors.append("Invalid phone number format")
                 return CreateCustomerResponse(customer=None, message="", errors=errors)
         
@@ -132,6 +277,31 @@ class CreateCustomer(graphene.Mutation):
             errors.append(str(e))
             return CreateCustomerResponse(customer=None, message="", errors=errors)
 
+    @staticmethod
+    async def mutate_async(input):
+        """CreateCustomer for async execution, using the async ORM"""
+        if await Customer.objects.filter(email=input.email).aexists():
+            return CreateCustomerResponse(customer=None, message="", errors=["Email already exists"])
+
+        if input.phone and not is_valid_phone(input.phone):
+            return CreateCustomerResponse(
+                customer=None, message="", errors=["Invalid phone number format"]
+            )
+
+        try:
+            customer = await Customer.objects.acreate(
+                name=input.name,
+                email=input.email,
+                phone=input.phone or ""
+            )
+        except Exception as e:
+            return CreateCustomerResponse(customer=None, message="", errors=[str(e)])
+        return CreateCustomerResponse(
+            customer=customer,
+            message="Customer created successfully",
+            errors=[]
+        )
+
 
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
@@ -139,34 +309,9 @@ class BulkCreateCustomers(graphene.Mutation):
 
     Output = BulkCreateCustomersResponse
 
+    @threaded
     def mutate(self, info, input):
-        customers = []
-        errors = []
-        
-        with transaction.atomic():
-            for customer_input in input:
-                try:
-                    # Validate email uniqueness
-                    if Customer.objects.filter(email=customer_input.email).exists():
-                        errors.append(f"Email {customer_input.email} already exists")
-                        continue
-                    
-                    # Validate phone format if provided
-                    if customer_input.phone:
-                        phone_pattern = r'^(\+\d{1,3}[- ]?)?\(?\d{3}\)?[- ]?\d{3}[- ]?\d{4}$'
-                        if not re.match(phone_pattern, customer_input.phone):
-                            errors.append(f"Invalid phone format for {customer_input.email}")
-                            continue
-                    
-                    customer = Customer.objects.create(
-                        name=customer_input.name,
-                        email=customer_input.email,
-                        phone=customer_input.phone or ""
-                    )
-                    customers.append(customer)
-                except Exception as e:
-                    errors.append(f"Error creating {customer_input.email}: {str(e)}")
-        
+        customers, errors = bulk_create_customers(input)
         return BulkCreateCustomersResponse(customers=customers, errors=errors)
 
 
@@ -191,16 +336,48 @@ class CreateProduct(graphene.Mutation):
         
         try:
             from decimal import Decimal
-            product = Product.objects.create(
+            values = dict(
                 name=input.name,
                 price=Decimal(str(input.price)),
                 stock=input.stock or 0
             )
+            if running_async():
+                return CreateProduct.create_async(values)
+            product = Product.objects.create(**values)
             return CreateProductResponse(product=product, errors=[])
         except Exception as e:
             errors.append(str(e))
             return CreateProductResponse(product=None, errors=errors)
 
+    @staticmethod
+    async def create_async(values):
+        try:
+            product = await Product.objects.acreate(**values)
+        except Exception as e:
+            return CreateProductResponse(product=None, errors=[str(e)])
+        return CreateProductResponse(product=product, errors=[])
+
+
+class BulkCreateProducts(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(ProductInput, required=True)
+        chunk_size = graphene.Int()
+
+    Output = BulkCreateProductsResponse
+
+    @threaded
+    def mutate(self, info, input, chunk_size=None):
+        try:
+            chunk_size = get_chunk_size(chunk_size)
+        except ValueError as e:
+            return BulkCreateProductsResponse(products=[], results=[], errors=[str(e)])
+        results = bulk_create_products(input, chunk_size)
+        return BulkCreateProductsResponse(
+            products=[result['product'] for result in results if result['product']],
+            results=results,
+            errors=_flatten_errors(results),
+        )
+
 
 class CreateOrder(graphene.Mutation):
     class Arguments:
@@ -209,6 +386,9 @@ class CreateOrder(graphene.Mutation):
     Output = CreateOrderResponse
 
     def mutate(self, info, input):
+        if running_async():
+            return CreateOrder.mutate_async(input)
+
         errors = []
         
         try:
@@ -218,49 +398,62 @@ class CreateOrder(graphene.Mutation):
             errors.append("Invalid customer ID")
             return CreateOrderResponse(order=None, errors=errors)
         
-        # Validate at least one product
-        if not input.product_ids:
-            errors.append("At least one product must be selected")
+        try:
+            lines = merge_lines(input.product_ids, input.quantities)
+            products = fetch_products(lines)
+        except OrderError as e:
+            errors.append(str(e))
             return CreateOrderResponse(order=None, errors=errors)
         
-        # Validate products exist
-        products = []
-        for product_id in input.product_ids:
-            try:
-                product = Product.objects.get(id=product_id)
-                products.append(product)
-            except Product.DoesNotExist:
-                errors.append(f"Invalid product ID: {product_id}")
-                return CreateOrderResponse(order=None, errors=errors)
-        
         try:
-            with transaction.atomic():
-                # Create order
-                order = Order.objects.create(
-                    customer=customer,
-                    total_amount=0  # Will be calculated below
-                )
-                
-                # Create order items and calculate total
-                total_amount = 0
-                for product in products:
-                    order_item = OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=1,
-                        price=product.price
-                    )
-                    total_amount += product.price
-                
-                # Update order total
-                order.total_amount = total_amount
-                order.save()
-                
-                return CreateOrderResponse(order=order, errors=[])
+            order = create_order(customer, lines, products)
+            return CreateOrderResponse(order=order, errors=[])
         except Exception as e:
             errors.append(str(e))
             return CreateOrderResponse(order=None, errors=errors)
 
+    @staticmethod
+    async def mutate_async(input):
+        """CreateOrder for async execution; the order is written in a worker thread"""
+        try:
+            customer = await Customer.objects.aget(id=input.customer_id)
+        except Customer.DoesNotExist:
+            return CreateOrderResponse(order=None, errors=["Invalid customer ID"])
+
+        try:
+            lines = merge_lines(input.product_ids, input.quantities)
+            products = await sync_to_async(fetch_products)(lines)
+        except OrderError as e:
+            return CreateOrderResponse(order=None, errors=[str(e)])
+
+        try:
+            # create_order locks product rows inside transaction.atomic()
+            order = await sync_to_async(create_order)(customer, lines, products)
+        except Exception as e:
+            return CreateOrderResponse(order=None, errors=[str(e)])
+        return CreateOrderResponse(order=order, errors=[])
+
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+        chunk_size = graphene.Int()
+
+    Output = BulkCreateOrdersResponse
+
+    @threaded
+    def mutate(self, info, input, chunk_size=None):
+        try:
+            chunk_size = get_chunk_size(chunk_size)
+        except ValueError as e:
+            return BulkCreateOrdersResponse(orders=[], results=[], errors=[str(e)])
+        results = bulk_create_orders(input, chunk_size)
+        return BulkCreateOrdersResponse(
+            orders=[result['order'] for result in results if result['order']],
+            results=results,
+            errors=_flatten_errors(results),
+        )
+
 
 class UpdateLowStockProducts(graphene.Mutation):
     """
@@ -272,19 +465,13 @@ class UpdateLowStockProducts(graphene.Mutation):
     
     Output = UpdateLowStockProductsResponse
     
+    @threaded
     def mutate(self, info):
         errors = []
         updated_products = []
         
         try:
-            # Find products with stock < 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            
-            # Update each product's stock
-            for product in low_stock_products:
-                product.stock += 10
-                product.save()
-                updated_products.append(product)
+            updated_products = restock_low_stock(threshold=10, amount=10)
             
             success_message = f"Updated {len(updated_products)} low stock products"
             
@@ -307,9 +494,23 @@ class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
+    bulk_create_products = BulkCreateProducts.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
+    # Models each mutation writes; cached query responses that read them
+    # are evicted (see crm/cache.py)
+    invalidates = {
+        'create_customer': (Customer,),
+        'bulk_create_customers': (Customer,),
+        'create_product': (Product,),
+        'bulk_create_products': (Product,),
+        'create_order': (Order, OrderItem, Product, Customer),
+        'bulk_create_orders': (Order, OrderItem, Product, Customer),
+        'update_low_stock_products': (Product,),
+    }
+
 
 # Query Class
 class Query(graphene.ObjectType):
@@ -326,30 +527,87 @@ class Query(graphene.ObjectType):
     # Order queries
     all_orders = graphene.List(OrderType)
     order = graphene.Field(OrderType, id=graphene.ID(required=True))
+
+    # Aggregate statistics
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        start=graphene.DateTime(),
+        end=graphene.DateTime(),
+        group_by=StatsPeriod(),
+        percentiles=graphene.List(graphene.Float),
+    )
+
+    # Paginated, filterable connections
+    customers = KeysetConnectionField(
+        CustomerType, filterset_class=CustomerFilter, ordering=('-created_at', '-id')
+    )
+    products = KeysetConnectionField(
+        ProductType, filterset_class=ProductFilter, ordering=('-created_at', '-id')
+    )
+    orders = KeysetConnectionField(
+        OrderType, filterset_class=OrderFilter, ordering=('-order_date', '-id')
+    )
+    orders_since = KeysetConnectionField(
+        OrderType,
+        filterset_class=OrderFilter,
+        ordering=('-order_date', '-id'),
+        since=graphene.DateTime(required=True),
+    )
     
     def resolve_all_customers(self, info, **kwargs):
-        return Customer.objects.all()
+        return _all(optimize_queryset(Customer.objects.all(), info), info)
     
     def resolve_all_products(self, info, **kwargs):
-        return Product.objects.all()
+        return _all(optimize_queryset(Product.objects.all(), info), info)
     
     def resolve_all_orders(self, info, **kwargs):
-        return Order.objects.all()
+        return _all(optimize_queryset(Order.objects.all(), info), info)
+    
+    def resolve_crm_stats(self, info, start=None, end=None, group_by=None, percentiles=None):
+        stats = CRMStats(
+            start=start,
+            end=end,
+            group_by=group_by.value if group_by else None,
+            percentiles=percentiles if percentiles is not None else DEFAULT_PERCENTILES,
+        )
+        if running_async():
+            # The statistics are computed lazily by attribute access; run
+            # the aggregates for the selected fields in a worker thread
+            return run_sync(_evaluate, stats, selected_fields(info))
+        return stats
+    
+    def resolve_orders_since(self, info, since, **kwargs):
+        return Order.objects.filter(order_date__gte=since)
     
     def resolve_customer(self, info, id):
-        try:
-            return Customer.objects.get(id=id)
-        except Customer.DoesNotExist:
-            return None
+        return _get(optimize_queryset(Customer.objects.all(), info), id)
     
     def resolve_product(self, info, id):
-        try:
-            return Product.objects.get(id=id)
-        except Product.DoesNotExist:
-            return None
+        return _get(optimize_queryset(Product.objects.all(), info), id)
     
     def resolve_order(self, info, id):
-        try:
-            return Order.objects.get(id=id)
-        except Order.DoesNotExist:
-            return None
+        return _get(optimize_queryset(Order.objects.all(), info), id)
+
+
+def _all(queryset, info):
+    stream = get_stream(info)
+    if stream is not None:
+        return stream.resolve(queryset)
+    if running_async():
+        return alist(queryset)
+    return queryset
+
+
+def _get(queryset, id):
+    if running_async():
+        return aget_or_none(queryset, id=id)
+    try:
+        return queryset.get(id=id)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+def _evaluate(stats, fields):
+    for name in fields:
+        getattr(stats, name, None)
+    return stats
@@ -0,0 +1,166 @@
+"""
+Aggregate CRM statistics computed in SQL
+
+Counts and revenue come from COUNT/SUM aggregates, so the cost of a
+report does not depend on serializing every row. Each figure is only
+computed when it is asked for.
+
+When the window boundaries fall on whole hours, order counts, revenue and
+the per-period breakdown are summed from HourlyOrderRollup instead of the
+Order table. Percentiles need the individual order totals, so they always
+read the Order table, in a single window-function query.
+"""
+
+from decimal import Decimal
+from functools import cached_property
+
+from django.db.models import Count, F, Min, Q, Sum, Window
+from django.db.models.functions import RowNumber, TruncDay, TruncMonth, TruncWeek
+
+from .models import Customer, HourlyOrderRollup, Order
+
+
+PERIOD_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+CENTS = Decimal('0.01')
+
+
+def _money(value):
+    return (value or Decimal('0')).quantize(CENTS)
+
+
+def _on_the_hour(value):
+    return value is None or (value.minute, value.second, value.microsecond) == (0, 0, 0)
+
+
+class CRMStats:
+    """
+    Customer count, order count, revenue and order-value percentiles for
+    orders placed in ``[start, end)``.
+
+    ``group_by`` ('day', 'week' or 'month') enables a per-period breakdown.
+    """
+
+    def __init__(self, start=None, end=None, group_by=None, percentiles=DEFAULT_PERCENTILES):
+        self.start = start
+        self.end = end
+        self.group_by = group_by
+        self.requested_percentiles = percentiles
+
+    @property
+    def customers(self):
+        customers = Customer.objects.all()
+        if self.start:
+            customers = customers.filter(created_at__gte=self.start)
+        if self.end:
+            customers = customers.filter(created_at__lt=self.end)
+        return customers
+
+    @property
+    def orders(self):
+        orders = Order.objects.all()
+        if self.start:
+            orders = orders.filter(order_date__gte=self.start)
+        if self.end:
+            orders = orders.filter(order_date__lt=self.end)
+        return orders
+
+    @property
+    def uses_rollups(self):
+        return _on_the_hour(self.start) and _on_the_hour(self.end)
+
+    @property
+    def rollups(self):
+        rollups = HourlyOrderRollup.objects.all()
+        if self.start:
+            rollups = rollups.filter(hour__gte=self.start)
+        if self.end:
+            rollups = rollups.filter(hour__lt=self.end)
+        return rollups
+
+    @cached_property
+    def totals(self):
+        if self.uses_rollups:
+            totals = self.rollups.aggregate(order_count=Sum('order_count'), revenue=Sum('revenue'))
+            totals['order_count'] = totals['order_count'] or 0
+            return totals
+        return self.orders.aggregate(order_count=Count('id'), revenue=Sum('total_amount'))
+
+    @cached_property
+    def customer_count(self):
+        return self.customers.count()
+
+    @property
+    def order_count(self):
+        return self.totals['order_count']
+
+    @property
+    def revenue(self):
+        return _money(self.totals['revenue'])
+
+    @property
+    def average_order_value(self):
+        if not self.order_count:
+            return _money(None)
+        return _money(self.totals['revenue'] / self.order_count)
+
+    @cached_property
+    def percentiles(self):
+        """
+        Nearest-rank percentiles of order totals.
+
+        Every order in the window is numbered by total_amount once, and
+        each percentile is the smallest total whose row number reaches
+        ``percentile / 100 * order_count``. All percentiles come from that
+        one query, which reads the Order table even when the totals use
+        the rollups.
+        """
+        percentiles = [p for p in self.requested_percentiles if 0 < p <= 100]
+        if not percentiles:
+            return []
+
+        # Row numbers are scaled by 100 so the comparison needs no division
+        ranked = self.orders.annotate(
+            scaled_rank=Window(RowNumber(), order_by=F('total_amount').asc()) * 100,
+            row_count=Window(Count('id')),
+        )
+        values = ranked.aggregate(**{
+            str(index): Min('total_amount', filter=Q(scaled_rank__gte=percentile * F('row_count')))
+            for index, percentile in enumerate(percentiles)
+        })
+        if values['0'] is None:
+            return []
+        return [
+            {'percentile': percentile, 'value': _money(values[str(index)])}
+            for index, percentile in enumerate(percentiles)
+        ]
+
+    @cached_property
+    def periods(self):
+        if not self.group_by:
+            return []
+
+        trunc = PERIOD_FUNCTIONS[self.group_by]
+        if self.uses_rollups:
+            rows = self.rollups.annotate(period=trunc('hour')).values('period').annotate(
+                order_count=Sum('order_count'), revenue=Sum('revenue')
+            )
+        else:
+            rows = self.orders.annotate(period=trunc('order_date')).values('period').annotate(
+                order_count=Count('id'), revenue=Sum('total_amount')
+            )
+
+        return [
+            {
+                'period_start': row['period'],
+                'order_count': row['order_count'],
+                'revenue': _money(row['revenue']),
+            }
+            for row in rows.order_by('period')
+        ]
@@ -0,0 +1,115 @@
+"""
+Stock reservation and restocking for CRM products
+
+Stock changes are written with ``F()`` expressions inside the database
+rather than read-modify-write in Python, so concurrent orders cannot
+lose updates. Rows are locked in primary key order so two orders that
+share products always queue on the same lock first instead of
+deadlocking.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    """Raised when a product does not have enough stock for an order"""
+
+
+def reserve_stock(lines):
+    """
+    Decrement stock for ``{product_id: quantity}`` in one statement.
+
+    Must run inside ``transaction.atomic()``; raises InsufficientStock,
+    which rolls the surrounding transaction back, when any product is
+    short or was deleted since the order was validated.
+    """
+    product_ids = sorted(lines)
+    locked = {
+        pk: (name, stock)
+        for pk, name, stock in Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .order_by('pk')
+        .values_list('pk', 'name', 'stock')
+    }
+
+    for product_id in product_ids:
+        if product_id not in locked:
+            # Callers report InsufficientStock as an order error
+            raise InsufficientStock(f"Invalid product ID: {product_id}")
+        name, stock = locked[product_id]
+        if stock < lines[product_id]:
+            raise InsufficientStock(
+                f"Insufficient stock for {name}: {stock} available, {lines[product_id]} requested"
+            )
+
+    guard = Q()
+    whens = []
+    for product_id in product_ids:
+        guard |= Q(pk=product_id, stock__gte=lines[product_id])
+        whens.append(When(pk=product_id, then=F('stock') - lines[product_id]))
+
+    updated = Product.objects.filter(guard).update(
+        stock=Case(*whens, default=F('stock'), output_field=PositiveIntegerField()),
+        updated_at=timezone.now(),
+    )
+    # The guard makes the UPDATE safe on backends without row locks too
+    if updated != len(product_ids):
+        raise InsufficientStock("Insufficient stock for one or more products")
+
+
+def restock_low_stock(threshold=10, amount=10):
+    """
+    Add ``amount`` to every product with stock below ``threshold``.
+
+    Runs as a single ``UPDATE ... RETURNING`` where the backend supports
+    it and returns the updated products.
+    """
+    if _supports_update_returning():
+        return _restock_returning(threshold, amount)
+
+    with transaction.atomic():
+        product_ids = list(
+            Product.objects.select_for_update()
+            .filter(stock__lt=threshold)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        Product.objects.filter(pk__in=product_ids).update(
+            stock=F('stock') + amount,
+            updated_at=timezone.now(),
+        )
+        return list(Product.objects.filter(pk__in=product_ids))
+
+
+def _supports_update_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        # UPDATE ... RETURNING arrived in SQLite 3.35
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _restock_returning(threshold, amount):
+    qn = connection.ops.quote_name
+    opts = Product._meta
+    stock = qn(opts.get_field('stock').column)
+    updated_at = qn(opts.get_field('updated_at').column)
+    columns = ', '.join(qn(field.column) for field in opts.concrete_fields)
+
+    sql = (
+        f"UPDATE {qn(opts.db_table)} "
+        f"SET {stock} = {stock} + %s, {updated_at} = %s "
+        f"WHERE {stock} < %s "
+        f"RETURNING {columns}"
+    )
+    now = timezone.now()
+    params = [amount, opts.get_field('updated_at').get_db_prep_value(now, connection), threshold]
+    with transaction.atomic():
+        products = list(Product.objects.raw(sql, params))
+    products.sort(key=lambda product: product.name)
+    return products
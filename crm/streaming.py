@@ -0,0 +1,73 @@
+"""
+Streaming execution of root list queries
+
+With ``?stream`` on the URL, a query that selects a single root list field
+(``allOrders``, ``allCustomers``, ``allProducts``) is not materialized at
+once. The root resolver hands its queryset to a ``ListStream`` instead of
+returning it; the view then reads the queryset with
+``.iterator(chunk_size=...)`` and executes the selection once per chunk,
+writing each chunk of rows to a StreamingHttpResponse as soon as it is
+serialized. Peak memory is bounded by the chunk size rather than by the
+number of rows.
+"""
+
+from django.conf import settings
+from graphql import FieldNode, OperationType
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+class ListStream:
+    """The rows of the streamed root list field of one request"""
+
+    def __init__(self):
+        self.chunk_size = getattr(
+            settings, 'CRM_GRAPHQL_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE
+        )
+        self.queryset = None
+        self.rows = None
+
+    def resolve(self, queryset):
+        """
+        Called by a root list resolver. The first execution registers the
+        queryset and resolves to no rows; later executions resolve to the
+        chunk being streamed.
+        """
+        if self.rows is None:
+            self.queryset = queryset
+            return []
+        return self.rows
+
+    def chunks(self):
+        """Yield the rows of the registered queryset ``chunk_size`` at a time"""
+        chunk = []
+        # prefetch_related lookups run once per chunk with iterator()
+        for obj in self.queryset.iterator(chunk_size=self.chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def get_stream(info):
+    """Return the ListStream of the request being executed, or None"""
+    return getattr(info.context, 'graphql_stream', None)
+
+
+def streamed_field(operation_ast):
+    """
+    Return the FieldNode of the single root field of a query operation, or
+    None if the operation cannot be streamed.
+    """
+    if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+        return None
+    selections = operation_ast.selection_set.selections
+    if len(selections) != 1 or not isinstance(selections[0], FieldNode):
+        return None
+    field = selections[0]
+    if field.directives or field.selection_set is None:
+        return None
+    return field
@@ -0,0 +1,124 @@
+"""
+Denormalized per-customer order summaries
+
+Customer.last_order_date, order_count and lifetime_value are kept in sync
+with the Order table so that activity checks (inactive customers, lifetime
+value) read one row per customer instead of joining every order.
+
+Order writes reach ``apply_customer_deltas`` through the same delta
+pipeline that maintains the rollups (see crm/rollups.py), inside the
+transaction that wrote the orders. ``drifted_customers`` and
+``refresh_customers`` back the ``reconcile_customer_summaries`` command.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Customer, Order
+
+
+UPDATE_BATCH_SIZE = 250
+
+
+def apply_customer_deltas(deltas):
+    """
+    Apply ``{customer_id: (count, revenue, latest_added, removed)}``.
+
+    ``latest_added`` is the newest order_date added for the customer, or
+    None. When ``removed`` is true an order left the customer, so its
+    last_order_date is recomputed from the remaining orders.
+    """
+    deltas = {
+        customer_id: delta for customer_id, delta in deltas.items()
+        if delta[0] or delta[1] or delta[2] is not None or delta[3]
+    }
+    items = list(deltas.items())
+
+    for start in range(0, len(items), UPDATE_BATCH_SIZE):
+        batch = items[start:start + UPDATE_BATCH_SIZE]
+        count_cases = [When(pk=pk, then=Value(count)) for pk, (count, _, _, _) in batch if count]
+        value_cases = [When(pk=pk, then=Value(revenue)) for pk, (_, revenue, _, _) in batch if revenue]
+        date_cases = [
+            When(
+                Q(pk=pk) & (Q(last_order_date__isnull=True) | Q(last_order_date__lt=latest)),
+                then=Value(latest),
+            )
+            for pk, (_, _, latest, removed) in batch
+            if latest is not None and not removed
+        ]
+
+        updates = {}
+        if count_cases:
+            updates['order_count'] = F('order_count') + Case(*count_cases, default=Value(0))
+        if value_cases:
+            updates['lifetime_value'] = F('lifetime_value') + Case(
+                *value_cases,
+                default=Value(Decimal('0')),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        if date_cases:
+            updates['last_order_date'] = Case(*date_cases, default=F('last_order_date'))
+        if updates:
+            Customer.objects.filter(pk__in=[pk for pk, _ in batch]).update(**updates)
+
+    removed = [pk for pk, (_, _, _, was_removed) in items if was_removed]
+    for start in range(0, len(removed), UPDATE_BATCH_SIZE):
+        Customer.objects.filter(pk__in=removed[start:start + UPDATE_BATCH_SIZE]).update(
+            last_order_date=_latest_order_subquery(),
+        )
+
+
+def actual_summaries(queryset=None):
+    """Annotate customers with summaries computed from their orders"""
+    if queryset is None:
+        queryset = Customer.objects.all()
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    return queryset.annotate(
+        actual_last_order_date=Subquery(orders.annotate(value=Max('order_date')).values('value')[:1]),
+        actual_order_count=Coalesce(Subquery(orders.annotate(value=Count('id')).values('value')[:1]), 0),
+        actual_lifetime_value=Coalesce(
+            Subquery(orders.annotate(value=Sum('total_amount')).values('value')[:1]),
+            # SQLite binds a Decimal as text, which never equals the stored 0
+            Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def drifted_customers(queryset=None):
+    """Customers whose stored summary no longer matches their orders"""
+    return actual_summaries(queryset).filter(
+        ~Q(order_count=F('actual_order_count'))
+        | ~Q(lifetime_value=F('actual_lifetime_value'))
+        | Q(last_order_date__isnull=True, actual_last_order_date__isnull=False)
+        | Q(last_order_date__isnull=False, actual_last_order_date__isnull=True)
+        # Negating a nullable comparison is true when both dates are NULL
+        | (
+            Q(last_order_date__isnull=False, actual_last_order_date__isnull=False)
+            & ~Q(last_order_date=F('actual_last_order_date'))
+        )
+    )
+
+
+def refresh_customers(customer_ids=None):
+    """Recompute the summaries of ``customer_ids`` (default: all) with one UPDATE"""
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    customers = Customer.objects.all()
+    if customer_ids is not None:
+        customers = customers.filter(pk__in=customer_ids)
+    return customers.update(
+        last_order_date=_latest_order_subquery(),
+        order_count=Coalesce(Subquery(orders.annotate(value=Count('id')).values('value')[:1]), 0),
+        lifetime_value=Coalesce(
+            Subquery(orders.annotate(value=Sum('total_amount')).values('value')[:1]),
+            Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def _latest_order_subquery():
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    return Subquery(orders.annotate(value=Max('order_date')).values('value')[:1])
@@ -5,7 +5,6 @@ Celery tasks for the CRM application
 import os
 import sys
 from datetime import datetime
-import requests
 from celery import shared_task
 
 # Add the project directory to Python path
@@ -19,7 +18,9 @@ import django
 django.setup()
 
 from django.db.models import Sum, Count
-from crm.models import Customer, Order
+from crm.models import Customer, HourlyOrderRollup
+from crm.client import GraphQLTransportError, get_client
+from crm.queries import CRM_STATS_QUERY
 
 
 @shared_task
@@ -28,36 +29,15 @@ def generate_crm_report():
     Generate a weekly CRM report summarizing total orders, customers, and revenue
     """
     try:
-        # GraphQL query to fetch CRM statistics
-        query = """
-        query GetCRMStats {
-            allCustomers {
-                id
-            }
-            allOrders {
-                id
-                totalAmount
-            }
-        }
-        """
-        
-        # Make GraphQL request
-        response = requests.post(
-            'http://localhost:8000/graphql/',
-            json={'query': query},
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
+        # Run the query in-process (or over HTTP, see crm/client.py)
+        response = get_client().execute(CRM_STATS_QUERY, timeout=60)
         
         if response.status_code == 200:
-            data = response.json()
-            customers_data = data.get('data', {}).get('allCustomers', [])
-            orders_data = data.get('data', {}).get('allOrders', [])
+            stats = (response.data or {}).get('crmStats') or {}
             
-            # Calculate statistics
-            total_customers = len(customers_data)
-            total_orders = len(orders_data)
-            total_revenue = sum(float(order['totalAmount']) for order in orders_data)
+            total_customers = stats.get('customerCount', 0)
+            total_orders = stats.get('orderCount', 0)
+            total_revenue = float(stats.get('revenue') or 0)
             
             # Format timestamp
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -80,7 +60,7 @@ def generate_crm_report():
                 f.write(error_log)
             return False
             
-    except requests.exceptions.RequestException as e:
+    except GraphQLTransportError as e:
         # Log connection error
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         error_log = f"{timestamp} - Connection error: {str(e)}\n"
@@ -105,8 +85,10 @@ def generate_crm_report_django_orm():
     try:
         # Use Django ORM to get statistics
         total_customers = Customer.objects.count()
-        total_orders = Order.objects.count()
-        total_revenue = Order.objects.aggregate(total=Sum('total_amount'))['total'] or 0
+        # Order totals come from the hourly rollups instead of scanning orders
+        totals = HourlyOrderRollup.objects.aggregate(orders=Sum('order_count'), revenue=Sum('revenue'))
+        total_orders = totals['orders'] or 0
+        total_revenue = totals['revenue'] or 0
         
         # Format timestamp
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -1,3 +1,976 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .models import Customer, Order, OrderItem, Product
+
+
+class GraphQLTestCase(TestCase):
+    """Posts operations to /graphql against a small set of CRM rows"""
+
+    url = '/graphql'
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=Decimal('2.50'), stock=5)
+            for i in range(3)
+        ]
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def post(self, body, url=None):
+        return self.client.post(url or self.url, json.dumps(body), content_type='application/json')
+
+    def query(self, query, variables=None, url=None, **extra):
+        return self.post({'query': query, 'variables': variables, **extra}, url).json()
+
+
+class BulkMutationTests(GraphQLTestCase):
+
+    def test_products_reject_chunk_size_below_one(self):
+        for chunk_size in (0, -5):
+            result = self.query(
+                'mutation ($size: Int) { bulkCreateProducts('
+                'input: [{name: "New", price: 1.0, stock: 2}], chunkSize: $size) '
+                '{ products { name } errors } }',
+                {'size': chunk_size},
+            )['data']['bulkCreateProducts']
+            self.assertEqual(result['products'], [])
+            self.assertEqual(result['errors'], ["Chunk size must be at least 1"])
+        self.assertFalse(Product.objects.filter(name="New").exists())
+
+    def test_orders_reject_chunk_size_below_one(self):
+        result = self.query(
+            'mutation ($customer: ID!, $product: ID!) { bulkCreateOrders('
+            'input: [{customerId: $customer, productIds: [$product]}], chunkSize: 0) '
+            '{ orders { id } errors } }',
+            {'customer': self.customer.pk, 'product': self.products[0].pk},
+        )['data']['bulkCreateOrders']
+        self.assertEqual(result['errors'], ["Chunk size must be at least 1"])
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_products_with_small_chunks(self):
+        result = self.query(
+            'mutation { bulkCreateProducts(input: ['
+            '{name: "A", price: 1.0}, {name: "B", price: -1}, {name: "C", price: 3.0, stock: 4}'
+            '], chunkSize: 1) { products { name } results { index errors } } }'
+        )['data']['bulkCreateProducts']
+        self.assertEqual([product['name'] for product in result['products']], ["A", "C"])
+        self.assertEqual(result['results'][1], {'index': 1, 'errors': ["Price must be positive"]})
+
+    def test_customers_report_errors_per_row(self):
+        result = self.query(
+            'mutation { bulkCreateCustomers(input: ['
+            '{name: "B", email: "b@example.com", phone: "bad"}, '
+            '{name: "B", email: "b@example.com", phone: ""}, '
+            '{name: "C", email: "alice@example.com"}, '
+            '{name: "D", email: "d@example.com"}, '
+            '{name: "D", email: "d@example.com"}'
+            ']) { customers { email } errors } }'
+        )['data']['bulkCreateCustomers']
+        self.assertEqual(
+            [customer['email'] for customer in result['customers']],
+            ["b@example.com", "d@example.com"],
+        )
+        self.assertEqual(result['errors'], [
+            "Invalid phone format for b@example.com",
+            "Email alice@example.com already exists",
+            "Email d@example.com already exists",
+        ])
+
+    def test_customers_fall_back_to_row_inserts_when_racing(self):
+        # A concurrent writer takes an email after both probes
+        with mock.patch('crm.bulk.existing_emails', return_value=set()):
+            result = self.query(
+                'mutation { bulkCreateCustomers(input: ['
+                '{name: "B", email: "b@example.com"}, {name: "A", email: "alice@example.com"}'
+                ']) { customers { email } errors } }'
+            )
+        result = result['data']['bulkCreateCustomers']
+        self.assertEqual([customer['email'] for customer in result['customers']], ["b@example.com"])
+        self.assertEqual(result['errors'], ["Email alice@example.com already exists"])
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_import_rejects_chunk_size_below_one(self):
+        from .imports import ImportFailed, Importer
+        with self.assertRaises(ImportFailed):
+            Importer('customers', chunk_size=0)
+
+
+class StockTests(GraphQLTestCase):
+
+    def order(self, *product_ids, quantities=None):
+        return self.query(
+            'mutation ($input: OrderInput!) { createOrder(input: $input) '
+            '{ order { totalAmount } errors } }',
+            {'input': {
+                'customerId': self.customer.pk,
+                'productIds': [str(product_id) for product_id in product_ids],
+                'quantities': quantities,
+            }},
+        )['data']['createOrder']
+
+    def test_order_reserves_stock(self):
+        result = self.order(self.products[0].pk, self.products[1].pk, quantities=[2, 5])
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['order']['totalAmount'], '17.50')
+        self.products[0].refresh_from_db()
+        self.products[1].refresh_from_db()
+        self.assertEqual((self.products[0].stock, self.products[1].stock), (3, 0))
+
+    def test_insufficient_stock_rolls_back_every_line(self):
+        result = self.order(self.products[0].pk, self.products[1].pk, quantities=[2, 6])
+        self.assertIsNone(result['order'])
+        self.assertIn("Insufficient stock for Product 1", result['errors'][0])
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('stock', flat=True)), [5, 5, 5]
+        )
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_product_deleted_after_validation(self):
+        from .orders import OrderError, create_order, fetch_products
+
+        product_id = self.products[0].pk
+        lines = {product_id: 1}
+        products = fetch_products(lines)
+        self.products[0].delete()
+        with self.assertRaisesMessage(OrderError, f"Invalid product ID: {product_id}"):
+            create_order(self.customer, lines, products)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_restock_low_stock(self):
+        Product.objects.filter(pk=self.products[0].pk).update(stock=20)
+        result = self.query(
+            'mutation { updateLowStockProducts { updatedProducts { name stock } } }'
+        )['data']['updateLowStockProducts']
+        self.assertEqual(
+            result['updatedProducts'],
+            [{'name': "Product 1", 'stock': 15}, {'name': "Product 2", 'stock': 15}],
+        )
+
+    def test_restock_without_update_returning(self):
+        from django.db import connection
+
+        from .stock import restock_low_stock
+
+        Product.objects.filter(pk=self.products[0].pk).update(stock=20)
+        with mock.patch.object(connection.Database, 'sqlite_version_info', (3, 34, 1)), \
+                mock.patch('crm.stock._restock_returning') as returning:
+            products = restock_low_stock(threshold=10, amount=3)
+        returning.assert_not_called()
+        self.assertEqual([(product.name, product.stock) for product in products], [
+            ("Product 1", 8), ("Product 2", 8),
+        ])
+
+
+class StatsTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for total in ('1.00', '2.00', '3.00', '4.00'):
+            Order.objects.create(customer=self.customer, total_amount=Decimal(total))
+
+    def stats(self):
+        return self.query(
+            '{ crmStats(percentiles: [50, 100]) { orderCount revenue percentiles { percentile value } } }'
+        )['data']['crmStats']
+
+    def test_percentiles(self):
+        stats = self.stats()
+        self.assertEqual((stats['orderCount'], stats['revenue']), (4, '10.00'))
+        self.assertEqual(
+            stats['percentiles'],
+            [{'percentile': 50.0, 'value': '2.00'}, {'percentile': 100.0, 'value': '4.00'}],
+        )
+
+    def test_percentiles_take_one_query(self):
+        from .stats import CRMStats
+
+        for total in range(5, 11):
+            Order.objects.create(customer=self.customer, total_amount=Decimal(total))
+        stats = CRMStats(percentiles=(0, 10, 70, 99.9, 100))
+        with self.assertNumQueries(1):
+            percentiles = stats.percentiles
+        self.assertEqual(
+            [(row['percentile'], row['value']) for row in percentiles],
+            [(10, Decimal('1.00')), (70, Decimal('7.00')), (99.9, Decimal('10.00')), (100, Decimal('10.00'))],
+        )
+
+    def test_percentiles_survive_rollup_drift(self):
+        # QuerySet.delete() of orders sends signals; raw deletes do not
+        Order.objects.filter(total_amount__gte=3)._raw_delete(Order.objects.db)
+        stats = self.stats()
+        self.assertEqual(stats['orderCount'], 4)
+        self.assertEqual(stats['percentiles'][1], {'percentile': 100.0, 'value': '2.00'})
+
+
+class DatabaseProfileTests(TestCase):
+
+    def test_cache_size_is_in_kib_whatever_its_sign(self):
+        import sqlite3
+
+        from alx_backend_graphql_crm.databases import sqlite_pragmas
+
+        for value in ('2048', '-2048'):
+            with mock.patch.dict('os.environ', {'CRM_DB_CACHE_SIZE': value}):
+                pragmas = sqlite_pragmas()
+            self.assertIn('PRAGMA cache_size=-2048', pragmas)
+            connection = sqlite3.connect(':memory:')
+            for pragma in pragmas:
+                connection.execute(pragma)
+            self.assertEqual(connection.execute('PRAGMA cache_size').fetchone(), (-2048,))
+            connection.close()
+
+
+class ExportTests(GraphQLTestCase):
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.client.get('/export/customers').status_code, 403)
+
+    @override_settings(CRM_EXPORT_TOKEN='secret')
+    def test_token(self):
+        response = self.client.get('/export/customers', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/export/customers?format=ndjson', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(self.content(response))['email'], "alice@example.com")
+
+    def test_staff_user(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(f'/export/products?after={self.products[0].pk}')
+        self.assertEqual(response.status_code, 200)
+        rows = self.content(response).splitlines()
+        self.assertEqual(rows[0], "id,name,price,stock,created_at")
+        self.assertEqual([row.split(',')[1] for row in rows[1:]], ["Product 1", "Product 2"])
+
+
+class KeysetPaginationTests(GraphQLTestCase):
+
+    def names(self, arguments):
+        result = self.query(
+            '{ products(%s) { edges { cursor node { name } } '
+            'pageInfo { hasNextPage hasPreviousPage } } }' % arguments
+        )
+        connection = result['data']['products']
+        return [edge['node']['name'] for edge in connection['edges']], connection
+
+    def test_forward_and_backward_pages(self):
+        names, connection = self.names('first: 2')
+        self.assertEqual(names, ["Product 2", "Product 1"])
+        self.assertTrue(connection['pageInfo']['hasNextPage'])
+
+        cursor = connection['edges'][-1]['cursor']
+        names, connection = self.names(f'first: 2, after: "{cursor}"')
+        self.assertEqual(names, ["Product 0"])
+        self.assertFalse(connection['pageInfo']['hasNextPage'])
+        self.assertTrue(connection['pageInfo']['hasPreviousPage'])
+
+        cursor = connection['edges'][0]['cursor']
+        names, connection = self.names(f'last: 1, before: "{cursor}"')
+        self.assertEqual(names, ["Product 1"])
+        self.assertTrue(connection['pageInfo']['hasPreviousPage'])
+
+    def test_rows_inserted_before_the_cursor_do_not_shift_the_page(self):
+        names, connection = self.names('first: 1')
+        cursor = connection['edges'][-1]['cursor']
+        Product.objects.create(name="Product 3", price=Decimal('1.00'))
+        names, _ = self.names(f'first: 1, after: "{cursor}"')
+        self.assertEqual(names, ["Product 1"])
+
+    def test_first_and_last_together_are_rejected(self):
+        result = self.query('{ products(first: 1, last: 1) { edges { node { name } } } }')
+        self.assertIsNone(result['data']['products'])
+        self.assertIn("both `first` and `last`", result['errors'][0]['message'])
+
+    def test_invalid_cursor(self):
+        result = self.query('{ products(after: "nope") { edges { node { name } } } }')
+        self.assertIsNone(result['data']['products'])
+
+
+class RollupTests(GraphQLTestCase):
+
+    def assertConsistent(self):
+        from django.db.models import Count, Sum
+
+        from .models import CustomerDailyRollup, HourlyOrderRollup
+        from .summaries import drifted_customers
+
+        orders = Order.objects.aggregate(count=Count('id'), revenue=Sum('total_amount'))
+        expected = (orders['count'], orders['revenue'] or 0)
+        for model in (HourlyOrderRollup, CustomerDailyRollup):
+            rollup = model.objects.aggregate(count=Sum('order_count'), revenue=Sum('revenue'))
+            self.assertEqual((rollup['count'] or 0, rollup['revenue'] or 0), expected, model.__name__)
+        self.assertEqual(list(drifted_customers()), [])
+
+    def test_save_and_delete(self):
+        order = Order.objects.create(customer=self.customer, total_amount=Decimal('4.00'))
+        Order.objects.create(customer=self.customer, total_amount=Decimal('1.00'))
+        self.assertConsistent()
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.order_count, self.customer.lifetime_value), (2, Decimal('5.00')))
+
+        order.total_amount = Decimal('10.00')
+        order.save()
+        self.assertConsistent()
+        order.delete()
+        self.assertConsistent()
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.order_count, self.customer.lifetime_value), (1, Decimal('1.00')))
+
+    def test_customers_without_orders_do_not_drift(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from .summaries import drifted_customers, refresh_customers
+
+        refresh_customers()
+        self.assertEqual(list(drifted_customers()), [])
+        output = StringIO()
+        call_command('reconcile_customer_summaries', stdout=output)
+        self.assertEqual(output.getvalue(), "Repaired 0 customer summaries\n")
+
+    def test_bulk_orders(self):
+        other = Customer.objects.create(name="Bob", email="bob@example.com")
+        result = self.query(
+            'mutation ($input: [OrderInput]!) { bulkCreateOrders(input: $input) { errors } }',
+            {'input': [
+                {'customerId': customer.pk, 'productIds': [self.products[0].pk]}
+                for customer in (self.customer, other, other)
+            ]},
+        )
+        self.assertEqual(result['data']['bulkCreateOrders']['errors'], [])
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertConsistent()
+
+    def test_clean_inactive_customers(self):
+        import os
+        from datetime import timedelta
+
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        other = Customer.objects.create(name="Bob", email="bob@example.com")
+        Order.objects.create(customer=self.customer, total_amount=Decimal('4.00'))
+        old_order = Order.objects.create(customer=other, total_amount=Decimal('2.00'))
+        # order_date is auto_now_add, so it can only be backdated by a later save
+        old_order.order_date = timezone.now() - timedelta(days=400)
+        old_order.save()
+        self.assertConsistent()
+        with mock.patch('crm.management.commands.clean_inactive_customers.LOG_FILE', os.devnull):
+            call_command('clean_inactive_customers', stdout=mock.Mock())
+        self.assertFalse(Customer.objects.filter(pk=other.pk).exists())
+        self.assertConsistent()
+
+
+class ResponseCacheTests(GraphQLTestCase):
+
+    def test_mutation_evicts_cached_responses(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        query = '{ allProducts { name } }'
+        self.query(query)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.query(query)['data']['allProducts']), 3)
+        self.assertEqual(len(queries), 0)
+
+        self.query('mutation { createProduct(input: {name: "New", price: 1.0}) { errors } }')
+        names = [product['name'] for product in self.query(query)['data']['allProducts']]
+        self.assertIn("New", names)
+
+    def test_stats_require_staff_or_token(self):
+        self.assertEqual(self.client.get('/graphql/cache-stats').status_code, 403)
+
+        self.query('{ hello }')
+        self.query('{ hello }')
+        with self.settings(CRM_EXPORT_TOKEN='secret'):
+            response = self.client.get('/graphql/cache-stats', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'enabled': True, 'hits': 1, 'misses': 1, 'evictions': 0})
+
+
+class PersistedQueryTests(GraphQLTestCase):
+
+    def test_miss_then_register_then_hit(self):
+        from .documents import query_hash
+
+        query = '{ allProducts { name } }'
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(query)}}
+
+        response = self.post({'extensions': extensions})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['errors'][0]['message'], 'PersistedQueryNotFound')
+
+        response = self.post({'query': query, 'extensions': extensions})
+        self.assertEqual(len(response.json()['data']['allProducts']), 3)
+
+        response = self.post({'extensions': extensions})
+        self.assertEqual(len(response.json()['data']['allProducts']), 3)
+
+    def test_hash_must_match_query(self):
+        response = self.post(
+            {'query': '{ hello }', 'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': 'bad'}}}
+        )
+        self.assertIn('errors', response.json())
+
+    @override_settings(CRM_GRAPHQL_PERSISTED_ONLY=True)
+    def test_persisted_only(self):
+        from .queries import CRM_STATS_QUERY, persisted_payload
+
+        self.assertIn('errors', self.post({'query': '{ hello }'}).json())
+        self.assertIn('crmStats', self.post(persisted_payload(CRM_STATS_QUERY)).json()['data'])
+
+
+class QueryCostTests(GraphQLTestCase):
+
+    operation = '{ customers(first: 10) { edges { node { name orders(first: 5) { edges { node { id } } } } } } }'
+
+    def test_cost_is_reported(self):
+        result = self.query(self.operation)
+        self.assertIn('customers', result['data'])
+        self.assertGreater(result['extensions']['cost']['requested'], 0)
+
+    def test_connection_wrappers_are_not_charged(self):
+        cost = self.query(self.operation)['extensions']['cost']
+        # 10 customers, each with up to 5 orders
+        self.assertEqual((cost['requested'], cost['depth']), (60, 7))
+
+    def test_unpaginated_three_level_query_is_accepted(self):
+        result = self.query(
+            '{ allCustomers { orders { edges { node { products { edges { node { name } } } } } } } }'
+        )
+        self.assertNotIn('errors', result)
+        self.assertEqual(result['extensions']['cost']['requested'], 1010100)
+
+    @override_settings(CRM_GRAPHQL_MAX_COST=10)
+    def test_expensive_query_is_rejected(self):
+        response = self.post({'query': self.operation})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeds the maximum cost of 10", response.json()['errors'][0]['message'])
+
+    @override_settings(CRM_GRAPHQL_MAX_DEPTH=3)
+    def test_deep_query_is_rejected(self):
+        response = self.post({'query': self.operation})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeds the maximum depth of 3", response.json()['errors'][0]['message'])
+
+
+class BatchTests(GraphQLTestCase):
+
+    def test_queries_after_a_mutation_see_the_write(self):
+        # Without the optimizer's prefetches, Customer.orders goes through the
+        # request's loaders, which the mutation has to reset for the last
+        # query to see the new order
+        query = {'query': '{ customer(id: %d) { orders { edges { node { totalAmount } } } } }' % self.customer.pk}
+        mutation = {
+            'query': 'mutation ($input: OrderInput!) { createOrder(input: $input) { errors } }',
+            'variables': {'input': {'customerId': self.customer.pk, 'productIds': [self.products[0].pk]}},
+        }
+        with mock.patch('crm.schema.optimize_queryset', lambda queryset, info: queryset):
+            response = self.post([query, mutation, query], '/graphql/batch')
+        self.assertEqual(response.status_code, 200)
+        before, created, after = response.json()
+        self.assertEqual(created['data']['createOrder']['errors'], [])
+        self.assertEqual(before['data']['customer']['orders']['edges'], [])
+        self.assertEqual(
+            after['data']['customer']['orders']['edges'], [{'node': {'totalAmount': '2.50'}}]
+        )
+
+    def test_mutation_evicts_cached_responses(self):
+        query = '{ allCustomers { email } }'
+        self.query(query)
+        self.post([{'query': 'mutation { createCustomer(input: {name: "Bob", email: "bob@example.com"}) '
+                             '{ errors } }'}], '/graphql/batch')
+        self.assertEqual(len(self.query(query)['data']['allCustomers']), 2)
+
+
+class LoaderTests(GraphQLTestCase):
+
+    query_text = (
+        '{ allOrders { customer { name } products { edges { node { name } } } '
+        'orderitemSet { edges { node { quantity product { name } } } } } }'
+    )
+
+    def add_orders(self, count):
+        for i in range(count):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"{i}-{count}@example.com")
+            order = Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+            for product in self.products[:2]:
+                OrderItem.objects.create(order=order, product=product, price=product.price)
+
+    def assertQueryCount(self, count):
+        caches['graphql'].clear()
+        with self.assertNumQueries(count):
+            result = self.query(self.query_text)
+        self.assertNotIn('errors', result)
+        return result['data']['allOrders']
+
+    def test_relations_take_a_fixed_number_of_queries(self):
+        for rows in (2, 10):
+            self.add_orders(rows)
+            self.assertQueryCount(3)
+
+    def test_loaders_batch_relations_without_the_optimizer(self):
+        with mock.patch('crm.schema.optimize_queryset', lambda queryset, info: queryset):
+            self.add_orders(2)
+            orders = self.assertQueryCount(4)
+            self.add_orders(10)
+            self.assertEqual(len(self.assertQueryCount(4)), 12)
+        self.assertEqual(
+            [edge['node']['product']['name'] for edge in orders[0]['orderitemSet']['edges']],
+            ["Product 0", "Product 1"],
+        )
+
+
+class OptimizerTests(GraphQLTestCase):
+
+    def capture(self, query_text):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.query(query_text)
+        self.assertNotIn('errors', result)
+        return [query['sql'] for query in queries]
+
+    def test_only_selected_columns_are_loaded(self):
+        sql = self.capture('{ allCustomers { id } }')
+        self.assertEqual(len(sql), 1)
+        self.assertTrue(sql[0].startswith('SELECT "crm_customer"."id" FROM'), sql[0])
+
+    def test_relations_are_prefetched_with_their_columns(self):
+        for total in ('1.00', '2.00'):
+            Order.objects.create(customer=self.customer, total_amount=Decimal(total))
+        with mock.patch('crm.loaders.Loaders._load_customer_orders') as load:
+            sql = self.capture('{ allCustomers { name orders { edges { node { totalAmount } } } } }')
+        load.assert_not_called()
+        self.assertEqual(len(sql), 2)
+        self.assertNotIn('"email"', sql[0])
+        self.assertIn('"crm_order"."total_amount"', sql[1])
+        self.assertNotIn('"order_date"', sql[1].split(' FROM ')[0])
+
+    def test_get_prefetched(self):
+        from .optimizer import get_prefetched
+
+        Order.objects.create(customer=self.customer, total_amount=Decimal('1.00'))
+        self.assertIsNone(get_prefetched(Customer.objects.get(), 'orders'))
+        customer = Customer.objects.prefetch_related('orders').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_prefetched(customer, 'orders')), 1)
+
+
+class CreateOrderTests(GraphQLTestCase):
+
+    def test_query_count_does_not_grow_with_products(self):
+        products = self.products + [
+            Product.objects.create(name=f"Product {i}", price=Decimal('1.00'), stock=5) for i in range(3, 6)
+        ]
+        for count in (1, len(products)):
+            caches['graphql'].clear()
+            with self.assertNumQueries(15):
+                result = self.query(
+                    'mutation ($input: OrderInput!) { createOrder(input: $input) '
+                    '{ order { products { edges { node { name } } } } errors } }',
+                    {'input': {
+                        'customerId': self.customer.pk,
+                        'productIds': [product.pk for product in products[:count]],
+                    }},
+                )['data']['createOrder']
+            self.assertEqual(result['errors'], [])
+            self.assertEqual(len(result['order']['products']['edges']), count)
+
+
+class IndexCheckTests(TestCase):
+
+    def test_migrated_schema_is_indexed(self):
+        from .checks import check_filter_indexes
+
+        self.assertEqual(check_filter_indexes(None), [])
+
+    def test_missing_index_is_reported(self):
+        from .checks import check_filter_indexes
+
+        with mock.patch.object(Product._meta, 'indexes', []):
+            warnings = check_filter_indexes(None)
+        self.assertEqual({warning.id for warning in warnings}, {'crm.W001'})
+        self.assertEqual([warning.msg for warning in warnings], [
+            "ProductFilter.price__gte filters on Product.price, which has no index.",
+            "ProductFilter.price__lte filters on Product.price, which has no index.",
+            "ProductFilter.stock__gte filters on Product.stock, which has no index.",
+            "ProductFilter.stock__lte filters on Product.stock, which has no index.",
+        ])
+
+
+class OrdersSinceTests(GraphQLTestCase):
+
+    def test_pages_across_equal_order_dates(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from graphql_relay import from_global_id
+
+        now = timezone.now()
+        orders = [Order.objects.create(customer=self.customer, total_amount=Decimal('1.00')) for _ in range(5)]
+        Order.objects.update(order_date=now)
+        Order.objects.filter(pk=orders[0].pk).update(order_date=now - timedelta(days=10))
+
+        seen = []
+        after = None
+        while True:
+            caches['graphql'].clear()
+            with self.assertNumQueries(1):
+                connection = self.query(
+                    'query ($since: DateTime!, $after: String) { ordersSince(since: $since, first: 2, after: $after) '
+                    '{ pageInfo { hasNextPage endCursor } edges { node { id customer { email } } } } }',
+                    {'since': (now - timedelta(days=7)).isoformat(), 'after': after},
+                )['data']['ordersSince']
+            seen += [edge['node']['id'] for edge in connection['edges']]
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            after = connection['pageInfo']['endCursor']
+
+        self.assertEqual(
+            [int(from_global_id(node_id)[1]) for node_id in seen],
+            [order.pk for order in reversed(orders[1:])],
+        )
+
+
+class BatchedConnectionTests(GraphQLTestCase):
+
+    def test_nested_connections_take_a_fixed_number_of_queries(self):
+        query_text = (
+            '{ customers(first: 20) { edges { node { email '
+            'orders(first: 1) { pageInfo { hasNextPage } edges { node { totalAmount } } } } } } }'
+        )
+        for count in (2, 8):
+            for i in range(count):
+                customer = Customer.objects.create(name="Bob", email=f"bob{count}-{i}@example.com")
+                for total in ('1.00', '2.00'):
+                    Order.objects.create(customer=customer, total_amount=Decimal(total))
+            caches['graphql'].clear()
+            with self.assertNumQueries(2):
+                edges = self.query(query_text)['data']['customers']['edges']
+            orders = [edge['node']['orders'] for edge in edges if edge['node']['email'].startswith('bob')]
+            self.assertEqual(len(orders), Customer.objects.filter(name="Bob").count())
+            self.assertEqual(
+                {(len(order['edges']), order['pageInfo']['hasNextPage']) for order in orders}, {(1, True)}
+            )
+
+
+class MigrationTests(TransactionTestCase):
+    """Runs the data migrations against rows written with historical models"""
+
+    def migrate(self, target=None):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connection)
+        targets = [('crm', target)] if target else executor.loader.graph.leaf_nodes()
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate()
+
+    def test_rollups_are_backfilled(self):
+        apps = self.migrate('0002_filter_and_ordering_indexes')
+        customer = apps.get_model('crm', 'Customer').objects.create(name="Alice", email="alice@example.com")
+        for total in ('1.00', '2.50'):
+            apps.get_model('crm', 'Order').objects.create(customer=customer, total_amount=Decimal(total))
+
+        apps = self.migrate('0003_order_rollups')
+        for name in ('HourlyOrderRollup', 'CustomerDailyRollup'):
+            rollups = apps.get_model('crm', name).objects.all()
+            self.assertEqual(
+                [(rollup.order_count, rollup.revenue) for rollup in rollups], [(2, Decimal('3.50'))]
+            )
+
+    def test_customer_summaries_are_backfilled(self):
+        apps = self.migrate('0003_order_rollups')
+        Customer = apps.get_model('crm', 'Customer')
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        Customer.objects.create(name="Bob", email="bob@example.com")
+        for total in ('1.00', '2.50'):
+            apps.get_model('crm', 'Order').objects.create(customer=customer, total_amount=Decimal(total))
+
+        apps = self.migrate('0004_customer_order_summary')
+        summaries = apps.get_model('crm', 'Customer').objects.order_by('name').values_list(
+            'order_count', 'lifetime_value', 'last_order_date'
+        )
+        (alice_count, alice_value, alice_date), bob = summaries
+        self.assertEqual((alice_count, alice_value), (2, Decimal('3.50')))
+        self.assertIsNotNone(alice_date)
+        self.assertEqual(bob, (0, Decimal('0.00'), None))
+
+
+class AsyncViewTests(GraphQLTestCase):
+
+    async def apost(self, body, url='/graphql/async'):
+        response = await self.async_client.post(url, json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_query(self):
+        result = await self.apost({'query': '{ hello allProducts { name } }'})
+        self.assertEqual(result['data']['hello'], "Hello, GraphQL!")
+        self.assertEqual(
+            [product['name'] for product in result['data']['allProducts']],
+            ["Product 0", "Product 1", "Product 2"],
+        )
+
+    async def test_mutation(self):
+        result = await self.apost({
+            'query': 'mutation ($input: CustomerInput!) { createCustomer(input: $input) '
+                     '{ customer { email } errors } }',
+            'variables': {'input': {'name': "Bob", 'email': "bob@example.com"}},
+        })
+        self.assertEqual(result['data']['createCustomer']['customer'], {'email': "bob@example.com"})
+        self.assertTrue(await Customer.objects.filter(email="bob@example.com").aexists())
+
+    async def test_parallel_batch(self):
+        query = {'query': '{ allCustomers { email } }'}
+        mutation = {'query': 'mutation { createCustomer(input: {name: "Bob", email: "bob@example.com"}) '
+                             '{ errors } }', 'id': 'write'}
+        results = await self.apost(
+            [{**query, 'id': 'a'}, {**query, 'id': 'b'}, mutation, {**query, 'id': 'c'}],
+            '/graphql/async/batch?parallel',
+        )
+        self.assertEqual([result['id'] for result in results], ['a', 'b', 'write', 'c'])
+        self.assertEqual(
+            [len(result['data']['allCustomers']) for result in results if result['id'] != 'write'],
+            [1, 1, 2],
+        )
+
+
+@override_settings(CRM_GRAPHQL_STREAM_CHUNK_SIZE=2)
+class StreamingTests(GraphQLTestCase):
+
+    def stream(self, query_text):
+        caches['graphql'].clear()
+        return self.post({'query': query_text}, '/graphql?stream')
+
+    def test_streamed_output_matches_the_buffered_response(self):
+        for i in range(5):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"{i}@example.com")
+            order = Order.objects.create(customer=customer, total_amount=Decimal(i))
+            OrderItem.objects.create(order=order, product=self.products[i % 3], price=Decimal('2.50'))
+        query_text = '{ orders: allOrders { totalAmount customer { name } products { edges { node { name } } } } }'
+
+        response = self.stream(query_text)
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b''.join(response.streaming_content))
+        caches['graphql'].clear()
+        self.assertEqual(streamed, self.query(query_text))
+        self.assertEqual(len(streamed['data']['orders']), 5)
+
+    def test_multiple_root_fields_are_not_streamed(self):
+        query_text = '{ allProducts { name } allCustomers { email } }'
+        response = self.stream(query_text)
+        self.assertFalse(response.streaming)
+        caches['graphql'].clear()
+        self.assertEqual(response.json(), self.query(query_text))
+        self.assertEqual(response.json()['data']['allCustomers'], [{'email': "alice@example.com"}])
+
+
+class ImportTests(GraphQLTestCase):
+
+    def run_import(self, table, text, suffix='.csv', **options):
+        import os
+        import tempfile
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'{table}{suffix}')
+            rejects = os.path.join(directory, f'rejects{suffix}')
+            with open(path, 'w') as f:
+                f.write(text)
+            output = StringIO()
+            call_command('import_crm', table, path, rejects=rejects, stdout=output, **options)
+            with open(rejects) as f:
+                rejected = f.read()
+        # Drop the timing
+        return output.getvalue().split(' in ')[0], rejected
+
+    def test_customers(self):
+        text = "name,email,phone\nBob,bob@example.com,+1-234-567-8900\nCarol,carol@example.com,\n"
+        summary, rejected = self.run_import('customers', text)
+        self.assertEqual(summary, "Read 2 rows: 2 written, 0 skipped, 0 rejected")
+        self.assertEqual(rejected, "")
+        self.assertEqual(Customer.objects.get(email="bob@example.com").phone, "+1-234-567-8900")
+
+    def test_products_report_each_stock_error(self):
+        text = (
+            '{"name": "A", "price": "1.50", "stock": 3}\n'
+            '{"name": "B", "price": "1.50", "stock": "x"}\n'
+            '{"name": "C", "price": "1.50", "stock": -1}\n'
+        )
+        summary, rejected = self.run_import('products', text, suffix='.ndjson')
+        self.assertEqual(summary, "Read 3 rows: 1 written, 0 skipped, 2 rejected")
+        self.assertEqual(
+            [(row['name'], row['error']) for row in map(json.loads, rejected.splitlines())],
+            [("B", "Stock must be an integer"), ("C", "Stock cannot be negative")],
+        )
+
+    def test_orders(self):
+        text = (
+            "customer_email,product_ids,quantities,order_date\n"
+            f"alice@example.com,{self.products[0].pk};{self.products[1].pk},2;1,2025-01-02T10:00:00Z\n"
+            "nobody@example.com,1,,\n"
+        )
+        summary, rejected = self.run_import('orders', text)
+        self.assertEqual(summary, "Read 2 rows: 1 written, 0 skipped, 1 rejected")
+        self.assertIn("Invalid customer ID", rejected)
+        order = Order.objects.get()
+        self.assertEqual((order.total_amount, order.order_date.day), (Decimal('7.50'), 2))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.order_count, 1)
+
+    def test_conflict_modes(self):
+        text = "name,email\nAlice Updated,alice@example.com\nBob,bob@example.com\n"
+
+        summary, rejected = self.run_import('customers', text)
+        self.assertEqual(summary, "Read 2 rows: 1 written, 0 skipped, 1 rejected")
+        self.assertIn("Email already exists", rejected)
+
+        summary, _ = self.run_import('customers', text, on_conflict='ignore')
+        self.assertEqual(summary, "Read 2 rows: 0 written, 2 skipped, 0 rejected")
+        self.assertEqual(Customer.objects.get(email="alice@example.com").name, "Alice")
+
+        summary, _ = self.run_import('customers', text, on_conflict='update')
+        self.assertEqual(summary, "Read 2 rows: 2 written, 0 skipped, 0 rejected")
+        self.assertEqual(Customer.objects.get(email="alice@example.com").name, "Alice Updated")
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class ClientTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import client
+
+        self.addCleanup(setattr, client, '_client', None)
+        client._client = None
+
+    def test_in_process_transport(self):
+        from .client import InProcessTransport
+        from .queries import HEARTBEAT_QUERY
+
+        transport = InProcessTransport()
+        response = transport.execute(HEARTBEAT_QUERY, timeout=60)
+        self.assertEqual((response.status_code, response.data), (200, {'hello': "Hello, GraphQL!"}))
+        self.assertTrue(response.ok)
+
+        response = transport.execute("{ missing }")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("missing", response.errors[0]['message'])
+
+        responses = transport.execute_batch([(HEARTBEAT_QUERY,), ("{ products { edges { node { name } } } }",)])
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(len(responses[1].data['products']['edges']), 3)
+
+    def test_in_process_timeout(self):
+        import itertools
+
+        from .client import GraphQLTransportError, InProcessTransport
+
+        # Each clock reading is 10 seconds after the last
+        with mock.patch('crm.client.time.monotonic', side_effect=itertools.count(0, 10)):
+            with self.assertRaisesMessage(GraphQLTransportError, "exceeded its 5s timeout"):
+                InProcessTransport().execute("{ products { edges { node { name } } } }", timeout=5)
+
+    def http_transport(self, *responses):
+        from .client import HTTPTransport
+
+        transport = HTTPTransport(url='http://crm.test/graphql', retries=2)
+        transport.session.post = mock.Mock(side_effect=responses)
+        return transport
+
+    def http_response(self, status_code, body=None):
+        return mock.Mock(status_code=status_code, json=mock.Mock(return_value=body or {}))
+
+    def test_http_retries_queries_with_backoff(self):
+        from .queries import HEARTBEAT_QUERY
+
+        transport = self.http_transport(
+            self.http_response(502),
+            self.http_response(503),
+            self.http_response(200, {'data': {'hello': "hi"}}),
+        )
+        with mock.patch('crm.client.time.sleep') as sleep, \
+                mock.patch('crm.client.random.uniform', side_effect=lambda low, high: high):
+            response = transport.execute(HEARTBEAT_QUERY, timeout=5)
+        self.assertEqual(response.data, {'hello': "hi"})
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(transport.session.post.call_args.kwargs['timeout'], (5, 5))
+
+    def test_http_retries_mutations_only_before_delivery(self):
+        import requests
+        from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+        from .client import GraphQLTransportError
+        from .queries import UPDATE_LOW_STOCK_MUTATION
+
+        refused = requests.exceptions.ConnectionError(
+            MaxRetryError(None, '/graphql', NewConnectionError(None, "refused"))
+        )
+        transport = self.http_transport(refused, self.http_response(502))
+        with mock.patch('crm.client.time.sleep'):
+            response = transport.execute(UPDATE_LOW_STOCK_MUTATION)
+        # Refused connections are retried; a 502 may have run the mutation
+        self.assertEqual((response.status_code, transport.session.post.call_count), (502, 2))
+
+        transport = self.http_transport(requests.exceptions.ReadTimeout("read timed out"))
+        with mock.patch('crm.client.time.sleep') as sleep:
+            with self.assertRaises(GraphQLTransportError):
+                transport.execute(UPDATE_LOW_STOCK_MUTATION)
+        sleep.assert_not_called()
+
+    def test_http_gzips_large_bodies(self):
+        import gzip
+
+        transport = self.http_transport(self.http_response(200), self.http_response(200))
+        transport.execute("{ hello }")
+        self.assertEqual(transport.session.post.call_args.kwargs['headers'], {})
+
+        query = "{ hello }" + " " * 2000
+        transport.execute(query)
+        kwargs = transport.session.post.call_args.kwargs
+        self.assertEqual(kwargs['headers'], {'Content-Encoding': 'gzip'})
+        self.assertEqual(json.loads(gzip.decompress(kwargs['data']))['query'], query)
+
+    def test_get_client(self):
+        from . import client
+
+        self.assertIsInstance(client.get_client().transport, client.InProcessTransport)
+        self.assertIs(client.get_client(), client.get_client())
+
+        client._client = None
+        with self.settings(CRM_GRAPHQL_TRANSPORT='http'):
+            self.assertIsInstance(client.get_client().transport, client.HTTPTransport)
+
+        client._client = None
+        with self.settings(CRM_GRAPHQL_TRANSPORT='carrier pigeon'):
+            with self.assertRaises(ValueError):
+                client.get_client()
+
+    def test_heartbeat_checks_the_endpoint(self):
+        from .client import GraphQLResponse
+        from .cron import log_crm_heartbeat
+
+        with mock.patch('crm.cron.HTTPTransport') as transport, mock.patch('crm.cron.open', mock.mock_open()) as log:
+            transport.return_value.execute.return_value = GraphQLResponse(200, {'hello': "hi"}, None)
+            self.assertTrue(log_crm_heartbeat())
+        transport.return_value.execute.assert_called_once()
+        self.assertEqual(transport.return_value.execute.call_args.kwargs['timeout'], 5)
+        self.assertIn("GraphQL endpoint is responsive", log().write.call_args_list[-1].args[0])
@@ -0,0 +1,13 @@
+"""
+Validation rules shared by the CRM mutations and bulk loaders
+"""
+
+import re
+
+
+PHONE_PATTERN = re.compile(r'^(\+\d{1,3}[- ]?)?\(?\d{3}\)?[- ]?\d{3}[- ]?\d{4}$')
+
+
+def is_valid_phone(phone):
+    """Return True when phone matches e.g. +1-234-567-8900 or 123-456-7890"""
+    return bool(PHONE_PATTERN.match(phone))
@@ -1,3 +1,607 @@
-from django.shortcuts import render
+import asyncio
+import json
+import zlib
+from functools import partial
+from inspect import isawaitable
+from itertools import groupby
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, validate_schema
+from graphql.execution import MiddlewareManager
+
+from .aio import ThreadedRelationMiddleware
+from .cache import analyze_query, get_response_cache
+from .cost import check_budget, cost_extension, operation_cost
+from .documents import PersistedQueryError, PersistedQueryNotFound, get_document, resolve_query
+from .exports import EXPORTS, ExportError, Exporter, gzip_chunks
+from .streaming import ListStream, streamed_field
+
+
+DEFAULT_BATCH_MAX_OPERATIONS = 20
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that executes cached, pre-validated documents, accepts
+    persisted queries, enforces the query cost budget, serves repeated
+    read-only queries from the response cache, evicts cached responses
+    when a mutation writes their models and streams large root lists.
+
+    With ``batch=True`` the view takes a JSON array of operations and runs
+    them in order on one request: they share its DataLoaders and database
+    connection, and each gets its own entry (with ``id`` and ``status``) in
+    the response array.
+    """
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        cached, on_result = self._check_cache(request, query, variables, operation_name, show_graphiql)
+        if cached is not None:
+            return cached, 200
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        result, status_code = self._encode_result(request, execution_result, id, show_graphiql)
+        if on_result is not None:
+            on_result(result, status_code)
+        return result, status_code
+
+    def _check_cache(self, request, query, variables, operation_name, show_graphiql):
+        """
+        Return ``(cached, on_result)``: a cached response to serve, or a
+        callback to run with the encoded response once the operation ran.
+        """
+        response_cache = get_response_cache()
+        if response_cache is None or show_graphiql or not query:
+            return None, None
+
+        plan = analyze_query(self.schema.graphql_schema, query, operation_name, self.validation_rules)
+        if plan is None:
+            # Let execution report the errors
+            return None, None
+
+        if plan.operation != 'query':
+            def invalidate(result, status_code):
+                if plan.writes:
+                    response_cache.invalidate(*plan.writes)
+            return None, invalidate
+        if self.batch:
+            # Batched responses carry the operation's id and status
+            return None, None
+
+        key = response_cache.key(plan.normalized, variables, operation_name, request.GET.get('pretty'))
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached, None
+
+        generations = response_cache.generations(plan.reads)
+
+        def store(result, status_code):
+            if status_code == 200 and result is not None and not getattr(request, 'graphql_errors', True):
+                response_cache.set(key, result, generations)
+        return None, store
+
+    def _encode_result(self, request, execution_result, id, show_graphiql=False):
+        """The tail of GraphQLView.get_response: status code and JSON body"""
+        response, status_code = self._response_data(request, execution_result, id)
+        if response is None:
+            return None, status_code
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def _response_data(self, request, execution_result, id=None):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if not execution_result:
+            return None, status_code
+
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return response, status_code
+
+    def execute_operation(self, request, query, variables=None, operation_name=None):
+        """
+        Run an operation in-process (see crm/client.py) and return the
+        response body and status code the endpoint would send, without
+        JSON encoding. Mutations evict cached responses as they do over HTTP.
+        """
+        try:
+            execution_result = self.execute_graphql_request(
+                request, {}, query, variables, operation_name
+            )
+        except HttpError as e:
+            return {"errors": [self.format_error(e)]}, e.response.status_code
+
+        response, status_code = self._response_data(request, execution_result)
+
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            plan = analyze_query(self.schema.graphql_schema, query, operation_name, self.validation_rules)
+            if plan is not None and plan.operation != 'query' and plan.writes:
+                response_cache.invalidate(*plan.writes)
+        return response, status_code
+
+    def dispatch(self, request, *args, **kwargs):
+        if 'stream' in request.GET and not self.batch:
+            try:
+                response = self.stream_response(request)
+            except HttpError as e:
+                return self._error_response(request, e)
+            if response is not None:
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def parse_body(self, request):
+        # Clients may gzip large request bodies (see crm/client.py)
+        if request.META.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            request._body = decompress_body(request.body)
+            del request.META['HTTP_CONTENT_ENCODING']
+        data = super().parse_body(request)
+
+        max_operations = getattr(settings, 'CRM_GRAPHQL_BATCH_MAX_OPERATIONS', DEFAULT_BATCH_MAX_OPERATIONS)
+        if self.batch and max_operations is not None and len(data) > max_operations:
+            raise HttpError(HttpResponseBadRequest(
+                f"Batch of {len(data)} operations exceeds the limit of {max_operations}."
+            ))
+        return data
+
+    def stream_response(self, request):
+        """
+        Serve a query selecting a single root list field as a
+        StreamingHttpResponse (see crm/streaming.py). Returns None when the
+        request should be handled as usual.
+        """
+        if request.method.lower() not in ("get", "post"):
+            return None
+        data = self.parse_body(request)
+        if self.graphiql and self.can_display_graphiql(request, data):
+            return None
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        document, operation_ast, _ = self._prepare(request, query, variables, operation_name, False)
+        field = streamed_field(operation_ast) if document is not None else None
+        if field is None:
+            return None
+
+        stream = request.graphql_stream = ListStream()
+        result = self._run(request, document, operation_ast, variables, operation_name)
+        if result.errors:
+            request.graphql_stream = None
+            return None
+        if stream.queryset is None:
+            # Not a list field that can be streamed; the result is complete
+            content, status_code = self._encode_result(request, result, id)
+            return HttpResponse(status=status_code, content=content, content_type="application/json")
+
+        key = field.alias.value if field.alias else field.name.value
+        return StreamingHttpResponse(
+            self._stream(request, document, operation_ast, variables, operation_name, stream, key),
+            content_type="application/json",
+        )
+
+    def _stream(self, request, document, operation_ast, variables, operation_name, stream, key):
+        """Yield the JSON response, executing the selection once per chunk of rows"""
+        yield '{"data":{%s:[' % json.dumps(key)
+
+        errors = []
+        offset = 0
+        written = False
+        try:
+            for rows in stream.chunks():
+                # Fresh DataLoaders so their caches do not grow with the response
+                request.loaders = None
+                stream.rows = rows
+                result = self._run(request, document, operation_ast, variables, operation_name)
+
+                for error in result.errors or ():
+                    formatted = self.format_error(error)
+                    path = formatted.get('path')
+                    if path and len(path) > 1 and isinstance(path[1], int):
+                        path[1] += offset
+                    errors.append(formatted)
+
+                items = (result.data or {}).get(key) or []
+                if items:
+                    yield (',' if written else '') + ','.join(
+                        json.dumps(item, separators=(',', ':')) for item in items
+                    )
+                    written = True
+                offset += len(rows)
+        except Exception as e:
+            errors.append(self.format_error(e))
+
+        tail = {}
+        if errors:
+            tail['errors'] = errors
+        query_cost = getattr(request, 'graphql_cost', None)
+        if query_cost is not None:
+            tail['extensions'] = {'cost': cost_extension(query_cost)}
+        yield ']}' + ''.join(
+            ',{}:{}'.format(json.dumps(name), json.dumps(value, separators=(',', ':')))
+            for name, value in tail.items()
+        ) + '}'
+
+    @staticmethod
+    def get_graphql_params(request, data):
+        query, variables, operation_name, id = GraphQLView.get_graphql_params(request, data)
+
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except Exception:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+
+        try:
+            query = resolve_query(query, extensions)
+        except PersistedQueryNotFound as e:
+            # Clients retry with the full query text on this error
+            raise HttpError(HttpResponse(str(e), status=200))
+        except PersistedQueryError as e:
+            raise HttpError(HttpResponseBadRequest(str(e)))
+        return query, variables, operation_name, id
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        result = self._execute(request, query, variables, operation_name, show_graphiql)
+        # Responses with errors are never cached
+        request.graphql_errors = bool(result is not None and result.errors)
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        query_cost = getattr(request, 'graphql_cost', None)
+        if query_cost is not None and 'extensions' not in d:
+            d = {**d, 'extensions': {'cost': cost_extension(query_cost)}}
+        return super().json_encode(request, d, pretty)
+
+    def _execute(self, request, query, variables, operation_name, show_graphiql):
+        """GraphQLView.execute_graphql_request, parsing through the document cache"""
+        document, operation_ast, result = self._prepare(
+            request, query, variables, operation_name, show_graphiql
+        )
+        if document is None:
+            return result
+        result = self._run(request, document, operation_ast, variables, operation_name)
+        self._after_operation(request, operation_ast)
+        return result
+
+    def _after_operation(self, request, operation_ast):
+        if self.batch and operation_ast.operation != OperationType.QUERY:
+            # Later operations of the batch must not see rows loaded before the write
+            request.loaders = None
+
+    def _run(self, request, document, operation_ast, variables, operation_name):
+        schema = self.schema.graphql_schema
+        try:
+            execute_options = self._execute_options(request, variables, operation_name)
+            if self._is_atomic(operation_ast):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def _prepare(self, request, query, variables, operation_name, show_graphiql):
+        """
+        Parse, validate and cost an operation. Returns ``(document,
+        operation_ast, None)`` when it should run, or ``(None, None, result)``.
+        """
+        if not query:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, None, ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document = get_document(schema, query, self.validation_rules)
+        if document.ast is None:
+            return None, None, ExecutionResult(errors=document.errors)
+        if document.errors:
+            return None, None, ExecutionResult(data=None, errors=document.errors)
+
+        operation_ast = get_operation_ast(document.ast, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        # Reject operations over the cost budget before running any SQL
+        query_cost = operation_cost(schema, document.ast, operation_name, variables)
+        # Set even when None, so batched operations never report another's cost
+        request.graphql_cost = query_cost
+        if query_cost is not None:
+            budget_error = check_budget(query_cost)
+            if budget_error is not None:
+                return None, None, ExecutionResult(data=None, errors=[budget_error])
+
+        return document.ast, operation_ast, None
+
+    def _execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    @staticmethod
+    def _is_atomic(operation_ast):
+        return (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.MUTATION
+            and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            )
+        )
+
+    def _error_response(self, request, e):
+        response = e.response
+        response["Content-Type"] = "application/json"
+        response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+        return response
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI servers.
+
+    The operation is executed on the event loop: root resolvers and the
+    single-row mutations use Django's async ORM, sibling fields that return
+    awaitables are resolved concurrently, and relations that still need a
+    query run in a worker thread (see crm/aio.py). Mutations under
+    ATOMIC_MUTATIONS run entirely in a worker thread, since a transaction
+    cannot span threads.
+
+    Batches sent with ``?parallel`` run each run of consecutive queries
+    concurrently; mutations still run one at a time, in order. Their
+    database work shares the request's one sync thread, and so one
+    connection.
+    """
+
+    view_is_async = True
+
+    def get_middleware(self, request):
+        middleware = self.middleware or []
+        if isinstance(middleware, MiddlewareManager):
+            middleware = middleware.middlewares
+        return [*middleware, ThreadedRelationMiddleware()]
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                # Rendering GraphiQL runs no operation
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = await self.get_batch_response_async(request, data)
+                result = "[{}]".format(",".join([response[0] for response in responses]))
+                status_code = (
+                    responses
+                    and max(responses, key=lambda response: response[1])[1]
+                    or 200
+                )
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            return self._error_response(request, e)
+
+    async def get_batch_response_async(self, request, data):
+        if 'parallel' not in request.GET:
+            return [await self.get_response_async(request, entry) for entry in data]
+
+        responses = []
+        for reads, entries in groupby(data, key=partial(self._is_read, request)):
+            if reads:
+                responses.extend(await asyncio.gather(
+                    *(self.get_response_async(request, entry) for entry in entries)
+                ))
+            else:
+                for entry in entries:
+                    responses.append(await self.get_response_async(request, entry))
+        return responses
+
+    def _is_read(self, request, data):
+        """True unless the batch entry is a mutation (or cannot be parsed)"""
+        try:
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+        except HttpError:
+            return False
+        if not query:
+            return False
+        plan = analyze_query(self.schema.graphql_schema, query, operation_name, self.validation_rules)
+        # Invalid operations fail without touching the database
+        return plan is None or plan.operation == 'query'
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        cached, on_result = self._check_cache(request, query, variables, operation_name, False)
+        if cached is not None:
+            return cached, 200
+
+        execution_result = await self.execute_graphql_request_async(
+            request, query, variables, operation_name
+        )
+        result, status_code = self._encode_result(request, execution_result, id)
+        if on_result is not None:
+            on_result(result, status_code)
+        return result, status_code
+
+    async def execute_graphql_request_async(self, request, query, variables, operation_name):
+        document, operation_ast, result = self._prepare(
+            request, query, variables, operation_name, False
+        )
+        if document is not None:
+            if self._is_atomic(operation_ast):
+                result = await sync_to_async(self._execute)(
+                    request, query, variables, operation_name, False
+                )
+            else:
+                query_cost = request.graphql_cost
+                result = await self._execute_async(request, document, variables, operation_name)
+                # Parallel batch operations may have costed theirs meanwhile
+                request.graphql_cost = query_cost
+                self._after_operation(request, operation_ast)
+        request.graphql_errors = bool(result is not None and result.errors)
+        return result
+
+    async def _execute_async(self, request, document, variables, operation_name):
+        try:
+            result = execute(
+                self.schema.graphql_schema,
+                document,
+                **self._execute_options(request, variables, operation_name),
+            )
+            if isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+def decompress_body(body):
+    """Gunzip a request body, bounded by DATA_UPLOAD_MAX_MEMORY_SIZE"""
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    try:
+        data = decompressor.decompress(body, limit + 1 if limit is not None else 0)
+    except zlib.error:
+        raise HttpError(HttpResponseBadRequest("Request body is not valid gzip."))
+    if limit is not None and len(data) > limit:
+        raise HttpError(HttpResponse("Request body is too large.", status=413))
+    return data
+
+
+def cache_stats(request):
+    """
+    Hit, miss and eviction counters of the GraphQL response cache, for
+    staff users and export token holders (see ``can_export``)
+    """
+    if not can_export(request):
+        return JsonResponse({'errors': ["Cache stats require a staff user or an export token"]}, status=403)
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return JsonResponse({'enabled': False})
+    return JsonResponse({'enabled': True, **response_cache.stats()})
+
+
+EXPORT_OPTIONS = {'format', 'gzip', 'after'}
+
+
+def can_export(request):
+    """True for active staff users and requests bearing CRM_EXPORT_TOKEN"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, 'CRM_EXPORT_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and constant_time_compare(credentials, token)
+
+
+@require_GET
+def export(request, name):
+    """
+    Stream a table as CSV or NDJSON (see crm/exports.py). Query parameters:
+    ``format`` (csv or ndjson), ``gzip``, ``after`` (resume cursor) and the
+    filters of the table's FilterSet.
+
+    Exports hold customer emails and phone numbers, so only staff users and
+    requests carrying ``Authorization: Bearer <CRM_EXPORT_TOKEN>`` are served.
+    """
+    if not can_export(request):
+        return JsonResponse({'errors': ["Exports require a staff user or an export token"]}, status=403)
+    if name not in EXPORTS:
+        raise Http404(f"Unknown export '{name}'")
+
+    filters = {key: value for key, value in request.GET.items() if key not in EXPORT_OPTIONS}
+    try:
+        after = request.GET.get('after')
+        exporter = Exporter(
+            name,
+            format=request.GET.get('format', 'csv'),
+            filters=filters,
+            after=int(after) if after else None,
+        )
+    except ValueError:
+        return JsonResponse({'errors': ["'after' must be an integer id"]}, status=400)
+    except ExportError as e:
+        return JsonResponse({'errors': [str(e)]}, status=400)
+
+    filename = exporter.filename
+    content = iter(exporter)
+    if 'gzip' in request.GET:
+        content = gzip_chunks(content)
+        filename += '.gz'
+    response = StreamingHttpResponse(
+        content,
+        content_type='application/gzip' if 'gzip' in request.GET else exporter.content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
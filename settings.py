@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from alx_backend_graphql_crm.databases import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -76,13 +78,10 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# CRM_DB_PROFILE selects sqlite (default), sqlite-wal or postgres; see
+# alx_backend_graphql_crm/databases.py
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+DATABASES = database_settings(BASE_DIR)
 
 
 # Password validation
@@ -126,9 +125,75 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Rows per bulk_create call in the bulk mutations
+CRM_BULK_CHUNK_SIZE = 1000
+
+# Caches. The 'graphql' alias holds cached responses of read-only GraphQL
+# queries; switch it to django.core.cache.backends.filebased.FileBasedCache
+# with a directory LOCATION to share entries between processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'graphql': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'crm-graphql',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Cache alias used for GraphQL responses; None disables the response cache.
+# With the local-memory backend every worker process has its own entries
+# and generation tokens, so a mutation handled by one worker does not evict
+# the others' entries: they can serve stale reads for up to TIMEOUT seconds.
+# Use a shared backend (file-based, Redis, ...) when running several workers.
+CRM_GRAPHQL_CACHE = 'graphql'
+
+# Parsed and validated GraphQL documents kept in memory per process
+CRM_GRAPHQL_DOCUMENT_CACHE_SIZE = 500
+
+# Only accept the persisted queries registered in crm/queries.py
+CRM_GRAPHQL_PERSISTED_ONLY = False
+
+# Static cost analysis of GraphQL operations (see crm/cost.py); operations
+# over either limit are rejected before they run. None disables a limit.
+# The cost budget admits three nested levels of up to 100 rows each
+# (about a million objects); a fourth unpaginated level is rejected.
+CRM_GRAPHQL_MAX_COST = 2000000
+CRM_GRAPHQL_MAX_DEPTH = 15
+# Rows assumed for list fields that take no pagination arguments
+CRM_GRAPHQL_DEFAULT_LIST_SIZE = 100
+
+# Rows per chunk when a root list query is streamed with ?stream
+CRM_GRAPHQL_STREAM_CHUNK_SIZE = 500
+
+# Rows read per query by the CSV/NDJSON exports (crm/exports.py)
+CRM_EXPORT_BATCH_SIZE = 2000
+
+# The /export endpoint serves staff users, and clients sending
+# "Authorization: Bearer <token>" with this token when it is set
+CRM_EXPORT_TOKEN = None
+
+# How cron jobs and Celery tasks run GraphQL operations (crm/client.py):
+# 'inprocess' executes them in the worker process, 'http' posts them to
+# CRM_GRAPHQL_URL (batches to CRM_GRAPHQL_BATCH_URL) with up to
+# CRM_GRAPHQL_HTTP_RETRIES retries and a default timeout in seconds
+CRM_GRAPHQL_TRANSPORT = 'inprocess'
+CRM_GRAPHQL_URL = 'http://localhost:8000/graphql'
+CRM_GRAPHQL_BATCH_URL = 'http://localhost:8000/graphql/batch'
+CRM_GRAPHQL_HTTP_RETRIES = 3
+CRM_GRAPHQL_HTTP_TIMEOUT = 30
+
+# Most operations accepted in one request by the batch endpoints
+CRM_GRAPHQL_BATCH_MAX_OPERATIONS = 20
+
 # GraphQL Settings
 GRAPHENE = {
-    'SCHEMA': 'schema.schema'
+    'SCHEMA': 'schema.schema',
+    'MIDDLEWARE': [
+        'crm.loaders.LoaderMiddleware',
+    ],
 }
 
 # Cron Jobs Configuration
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Concurrency stress test for the SQLite database profiles.
+
+Each profile runs in its own process against a seeded throwaway database
+file. Reader threads list customers, orders and low-stock products while
+writer threads run the CRM write paths concurrently:
+- bulk_create_customers, as BulkCreateCustomers does;
+- create_order, which reserves stock inside its transaction;
+- restock_low_stock, as the update_low_stock cron job does.
+For every profile the test reports throughput and the share of operations
+that failed with "database is locked":
+
+    python stress_sqlite.py --profiles sqlite sqlite-wal \\
+        --readers 8 --writers 4 --seconds 10
+
+The plain ``sqlite`` profile uses the rollback journal and BEGIN DEFERRED.
+Its readers block behind writers, and a transaction that reads before it
+writes fails as soon as another writer holds the lock. ``sqlite-wal``
+should report no lock errors.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from benchmark_db import seed
+
+
+def run_profile(readers, writers, seconds, customers):
+    """Stress the profile this process was started with"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    import django
+    django.setup()
+
+    from django.db import OperationalError, connection, connections
+    from django.db.models import Count
+
+    from crm.bulk import bulk_create_customers
+    from crm.models import Customer, Order, Product
+    from crm.orders import OrderError, create_order, fetch_products
+    from crm.stock import restock_low_stock
+
+    profile = os.environ.get('CRM_DB_PROFILE', 'sqlite')
+    if connection.vendor != 'sqlite':
+        sys.exit(f"{profile} is not a SQLite profile")
+    temp_dir = tempfile.TemporaryDirectory()
+    connection.settings_dict['TEST']['NAME'] = os.path.join(temp_dir.name, 'stress.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    def read():
+        random.choice((
+            lambda: list(Customer.objects.annotate(orders_placed=Count('orders'))[:50]),
+            lambda: list(Order.objects.select_related('customer').order_by('-order_date')[:50]),
+            lambda: Product.objects.filter(stock__lt=10).count(),
+        ))()
+
+    def write():
+        action = random.random()
+        if action < 0.4:
+            bulk_create_customers([
+                SimpleNamespace(name='Stress', email=f"{uuid.uuid4().hex}@example.com", phone='')
+                for _ in range(5)
+            ])
+        elif action < 0.9:
+            lines = {random.choice(product_ids): 1}
+            try:
+                create_order(random.choice(customer_list), lines, fetch_products(lines))
+            except OrderError:
+                # Out of stock until the next restock
+                pass
+        else:
+            restock_low_stock(threshold=10, amount=50)
+
+    counts = {kind: {'ok': 0, 'locked': 0, 'failed': 0} for kind in ('read', 'write')}
+    lock = threading.Lock()
+
+    def worker(kind, operation, deadline):
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    operation()
+                    outcome = 'ok'
+                except OperationalError as e:
+                    outcome = 'locked' if 'locked' in str(e) or 'busy' in str(e) else 'failed'
+                except Exception:
+                    outcome = 'failed'
+                with lock:
+                    counts[kind][outcome] += 1
+        finally:
+            connections.close_all()
+
+    try:
+        seed(customers)
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        customer_list = list(Customer.objects.all()[:50])
+
+        deadline = time.monotonic() + seconds
+        threads = (
+            [threading.Thread(target=worker, args=('read', read, deadline)) for _ in range(readers)]
+            + [threading.Thread(target=worker, args=('write', write, deadline)) for _ in range(writers)]
+        )
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report(profile, counts, time.monotonic() - start)
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        temp_dir.cleanup()
+
+
+def report(label, counts, elapsed):
+    parts = []
+    for kind, count in counts.items():
+        attempts = sum(count.values())
+        locked = count['locked'] / attempts if attempts else 0
+        parts.append(
+            f"{kind}s {count['ok'] / elapsed:8.1f}/s  locked {locked:6.1%}  failed {count['failed']}"
+        )
+    print(f"{label:<11} " + '   '.join(parts), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profiles', nargs='+', default=['sqlite', 'sqlite-wal'])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--customers', type=int, default=200, help='Customers to seed (3 orders each)')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args.readers, args.writers, args.seconds, args.customers)
+        return
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile")
+    for profile in args.profiles:
+        # The profile is read when settings load, so each needs its own process
+        result = subprocess.run(
+            [sys.executable, __file__, '--run', *sys.argv[1:]],
+            env={**os.environ, 'CRM_DB_PROFILE': profile},
+        )
+        if result.returncode:
+            print(f"{profile:<11} failed (exit status {result.returncode})")
+
+
+if __name__ == "__main__":
+    main()